@@ -8,12 +8,37 @@ class SearchRequest(BaseModel):
     ai_model_ids: List[str]
     num_results: Optional[int] = 5
 
+class BatchSearchRequest(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+    
+    requests: List[SearchRequest]
+    concurrency: Optional[int] = None
+
+class WarmQuery(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+    
+    query: str
+    num_results: Optional[int] = 5
+
+class WarmListRequest(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+    
+    queries: List[WarmQuery]
+
 class SearchResult(BaseModel):
     model_config = ConfigDict(protected_namespaces=())
     
     title: str
     url: str
     snippet: str
+    
+    @classmethod
+    def from_record(cls, record: Any) -> "SearchResult":
+        """
+        Convert an internal search result record. Its fields are already
+        plain strings, so validation is skipped.
+        """
+        return cls.model_construct(title=record.title, url=record.url, snippet=record.snippet)
 
 class ModelInfo(BaseModel):
     model_config = ConfigDict(protected_namespaces=())
@@ -28,10 +53,13 @@ class AIAnalysis(BaseModel):
     
     ai_model_id: str
     content: str
+    timed_out: bool = False
 
 class SearchResponse(BaseModel):
     model_config = ConfigDict(protected_namespaces=())
     
     query: str
     web_results: List[SearchResult]
-    ai_analyses: Dict[str, AIAnalysis] 
\ No newline at end of file
+    ai_analyses: Dict[str, AIAnalysis]
+    # Results whose page text was available to the models
+    included_sources: List[str] = [] 
\ No newline at end of file
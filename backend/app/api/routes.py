@@ -1,45 +1,293 @@
-from fastapi import APIRouter, HTTPException, Depends
-from app.api.models import SearchRequest, SearchResponse, ModelInfo
+import os
+import asyncio
+import hmac
+import json
+import time
+from fastapi import APIRouter, HTTPException, Depends, Request, Header
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from app.api.models import SearchRequest, SearchResponse, SearchResult, ModelInfo, BatchSearchRequest, WarmListRequest
+from app.services.batch_service import BatchService, request_key
 from app.services.search_service import SearchService
 from app.services.llm_service import LLMService
 from app.services.content_service import ContentService
-from typing import List
+from app.services.warming_service import WarmingService
+from app.utils.admission import admission, rate_limiter, Admission
+from app.utils.cache import cache_store
+from app.utils.health import get_health_snapshot
+from app.utils.metrics import STAGE_SECONDS, SEARCH_COALESCED
+from typing import List, Dict, Any, AsyncIterator, Optional
 
 router = APIRouter()
 search_service = SearchService()
 llm_service = LLMService()
 content_service = ContentService()
+warming_service = WarmingService(search_service, content_service)
+
+# Rate limit by the X-Forwarded-For address appended by the proxy in front of
+# the app; only enable behind exactly one such proxy
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "false").lower() in ("1", "true", "yes")
+
+# Token required by the admin endpoints; they are disabled when it is unset
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# Pipelines currently running, so identical concurrent requests share one,
+# and the number of clients waiting on each
+_pipelines: Dict[str, asyncio.Task] = {}
+_pipeline_waiters: Dict[str, int] = {}
 
 @router.post("/search", response_model=SearchResponse)
-async def search(request: SearchRequest):
+async def search(request: SearchRequest, http_request: Request):
+    rate_limiter.check(_client_id(http_request))
+    warming_service.record(request.query, request.num_results)
+    
+    # Join an identical request that is already running
+    key = request_key(request)
+    task = _pipelines.get(key)
+    if task is None:
+        task = asyncio.create_task(_run_search(request))
+        _pipelines[key] = task
+        _pipeline_waiters[key] = 0
+        task.add_done_callback(lambda finished: _finish_pipeline(key, finished))
+    else:
+        SEARCH_COALESCED.inc()
+    
+    response = await _wait_pipeline(key, task, http_request)
+    if response.query != request.query:
+        response = response.model_copy(update={"query": request.query})
+    return response
+
+async def _wait_pipeline(key: str, task: asyncio.Task, http_request: Request) -> SearchResponse:
+    """
+    Wait for a shared pipeline until it finishes or the client disconnects.
+    
+    One client leaving does not cancel the pipeline for the others, but once
+    every client has left it is cancelled, releasing its admission slot and
+    stopping its search, fetch and LLM calls.
+    """
+    _pipeline_waiters[key] += 1
+    disconnected = asyncio.create_task(_wait_for_disconnect(http_request))
+    try:
+        done, _ = await asyncio.wait({task, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+        if task in done:
+            return task.result()
+        # Nobody is left to read the response
+        raise HTTPException(status_code=499, detail="Client closed request")
+    finally:
+        disconnected.cancel()
+        if _pipelines.get(key) is task:
+            _pipeline_waiters[key] -= 1
+            if _pipeline_waiters[key] == 0 and not task.done():
+                task.cancel()
+                del _pipelines[key]
+                del _pipeline_waiters[key]
+
+async def _wait_for_disconnect(http_request: Request):
+    # The request body has been read, so the next message is the disconnect
+    while (await http_request.receive())["type"] != "http.disconnect":
+        pass
+
+def _finish_pipeline(key: str, task: asyncio.Task):
+    if _pipelines.get(key) is task:
+        del _pipelines[key]
+        del _pipeline_waiters[key]
+    # Mark the exception as retrieved even if every waiter has gone away
+    if not task.cancelled():
+        task.exception()
+
+async def _run_search(request: SearchRequest) -> SearchResponse:
+    async with admission.admit():
+        return await _pipeline(request)
+
+async def _pipeline(request: SearchRequest) -> SearchResponse:
     try:
         # Get search results
-        web_results = await search_service.search(request.query, request.num_results)
+        with STAGE_SECONDS.time(timing="search", stage="search"):
+            web_results = await search_service.search(request.query, request.num_results)
         
         # Extract content from top results
-        content = await content_service.extract_content(web_results)
+        with STAGE_SECONDS.time(timing="extract", stage="extract"):
+            sources = await content_service.gather_sources(web_results)
         
-        # Get AI analyses for each selected model
-        ai_analyses = {}
-        for ai_model_id in request.ai_model_ids:
-            analysis = await llm_service.analyze(
+        # Get AI analyses for all selected models concurrently
+        with STAGE_SECONDS.time(timing="analyze", stage="analyze"):
+            ai_analyses = await llm_service.analyze_all(
                 query=request.query,
-                content=content,
-                ai_model_id=ai_model_id
+                sources=sources,
+                ai_model_ids=request.ai_model_ids
             )
-            ai_analyses[ai_model_id] = analysis
             
         return SearchResponse(
             query=request.query,
-            web_results=web_results,
-            ai_analyses=ai_analyses
+            web_results=[SearchResult.from_record(result) for result in web_results],
+            ai_analyses=ai_analyses,
+            included_sources=[source.url for source in sources if source.text]
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+batch_service = BatchService(_pipeline)
+
+@router.post("/search/batch")
+async def search_batch(request: BatchSearchRequest, http_request: Request):
+    """
+    Run many searches in one call, streaming results as newline-delimited JSON.
+    
+    Each line holds a request's index and its "response" or "error", in the
+    order the searches finish. The whole batch takes one admission slot and
+    runs at most BATCH_MAX_CONCURRENCY searches at a time, and all batches
+    together at most BATCH_GLOBAL_CONCURRENCY.
+    """
+    if not request.requests:
+        raise HTTPException(status_code=400, detail="No requests in batch")
+    if len(request.requests) > batch_service.max_requests:
+        raise HTTPException(status_code=400, detail=f"At most {batch_service.max_requests} requests per batch")
+    
+    rate_limiter.check(_client_id(http_request))
+    slot = await admission.acquire()
+    return StreamingResponse(
+        _batch_lines(request, slot),
+        media_type="application/x-ndjson",
+        background=BackgroundTask(slot.release)
+    )
+
+async def _batch_lines(request: BatchSearchRequest, slot: Admission) -> AsyncIterator[str]:
+    try:
+        async for result in batch_service.run(request.requests, request.concurrency):
+            if "response" in result:
+                result["response"] = result["response"].model_dump()
+            yield json.dumps(result) + "\n"
+    finally:
+        slot.release()
+
+def _client_id(http_request: Request) -> str:
+    """
+    Identify the client for rate limiting, behind a trusted proxy if configured.
+    """
+    if TRUST_FORWARDED_FOR:
+        # Earlier entries come from the client and can be anything; the last
+        # one is the address the proxy saw
+        forwarded = http_request.headers.get("X-Forwarded-For")
+        if forwarded:
+            return forwarded.split(",")[-1].strip()
+    return http_request.client.host if http_request.client else "unknown"
+
+@router.post("/search/stream")
+async def search_stream(request: SearchRequest, http_request: Request):
+    """
+    Streaming variant of /search using Server-Sent Events.
+    
+    Emits a "results" event with the web results, a "sources" event listing
+    the pages the models get, then interleaved "token" events per model, a
+    "done" event as each model finishes and a final "end".
+    """
+    rate_limiter.check(_client_id(http_request))
+    warming_service.record(request.query, request.num_results)
+    # Admit before responding so that an overloaded server can still answer 503
+    slot = await admission.acquire()
+    return StreamingResponse(
+        _search_events(request, slot),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(slot.release)
+    )
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _search_events(request: SearchRequest, slot: Admission) -> AsyncIterator[str]:
+    try:
+        async for event in _stream_pipeline(request):
+            yield event
+    finally:
+        slot.release()
+
+async def _stream_pipeline(request: SearchRequest) -> AsyncIterator[str]:
+    try:
+        with STAGE_SECONDS.time(stage="search"):
+            web_results = await search_service.search(request.query, request.num_results)
+        yield _sse("results", {
+            "query": request.query,
+            "web_results": [SearchResult.from_record(result).model_dump() for result in web_results]
+        })
+        
+        with STAGE_SECONDS.time(stage="extract"):
+            sources = await content_service.gather_sources(web_results)
+        yield _sse("sources", {"included_sources": [source.url for source in sources if source.text]})
+    except Exception as e:
+        yield _sse("error", {"detail": str(e)})
+        return
+    
+    # Each model pushes its tokens onto one queue so they interleave
+    queue: asyncio.Queue = asyncio.Queue()
+    
+    async def pump(ai_model_id: str):
+        try:
+            content = llm_service.build_context(request.query, sources, ai_model_id)
+            async for token in llm_service.analyze_stream(request.query, content, ai_model_id):
+                await queue.put(("token", {"ai_model_id": ai_model_id, "content": token}))
+        except Exception as e:
+            await queue.put(("token", {"ai_model_id": ai_model_id, "content": f"Error: {str(e)}"}))
+        await queue.put(("done", {"ai_model_id": ai_model_id, "timed_out": False}))
+    
+    tasks = {
+        ai_model_id: asyncio.create_task(pump(ai_model_id))
+        for ai_model_id in dict.fromkeys(request.ai_model_ids)
+    }
+    finished = set()
+    deadline = time.monotonic() + llm_service.total_deadline
+    
+    try:
+        while len(finished) < len(tasks):
+            try:
+                event, data = await asyncio.wait_for(queue.get(), timeout=deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                for ai_model_id in tasks.keys() - finished:
+                    yield _sse("done", {"ai_model_id": ai_model_id, "timed_out": True})
+                break
+            
+            if event == "done":
+                finished.add(data["ai_model_id"])
+            yield _sse(event, data)
+        
+        yield _sse("end", {})
+    finally:
+        # Stop any model still streaming, e.g. when the client disconnects
+        for task in tasks.values():
+            task.cancel()
+
 @router.get("/models", response_model=List[ModelInfo])
 async def get_models():
     try:
         return llm_service.get_available_models()
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e)) 
+
+@router.get("/cache/stats")
+async def get_cache_stats() -> Dict[str, Any]:
+    return cache_store.get_stats()
+
+@router.get("/health/backends")
+async def get_backend_health() -> Dict[str, Any]:
+    return get_health_snapshot()
+
+def _require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@router.get("/warm", dependencies=[Depends(_require_admin)])
+async def get_warm_status() -> Dict[str, Any]:
+    """
+    The warm list, the most popular recent queries and the last warming run.
+    """
+    return warming_service.snapshot()
+
+@router.put("/warm/queries", dependencies=[Depends(_require_admin)])
+async def set_warm_queries(request: WarmListRequest) -> Dict[str, Any]:
+    """
+    Replace the list of queries that are kept warm regardless of traffic.
+    """
+    warming_service.set_warm_list([(query.query, query.num_results) for query in request.queries])
+    return warming_service.snapshot()
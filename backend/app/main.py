@@ -4,11 +4,42 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
-from fastapi import FastAPI
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from app.api.routes import router
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app.api.routes import router, content_service, warming_service
+from app.utils.http_client import http_client
+from app.utils.admission import Overloaded
+from app.utils.cache import close_shared_backend
+from app.utils.lazy import preload
+from app.utils.metrics import metrics, server_timings, format_server_timing, REQUEST_SECONDS, REQUESTS_IN_FLIGHT
 
-app = FastAPI(title="LUMA API", description="API for LUMA - Luminous AI Search")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the shared HTTP connection pool and start the cache warmer on
+    # startup. The extraction workers and heavy imports are set up in the
+    # background, so the server accepts requests as soon as possible.
+    await http_client.start()
+    warm_up = asyncio.create_task(_warm_up())
+    await warming_service.start()
+    yield
+    warm_up.cancel()
+    await warming_service.stop()
+    content_service.extraction_pool.close()
+    await http_client.close()
+    await close_shared_backend()
+
+async def _warm_up():
+    try:
+        await content_service.extraction_pool.start()
+        await preload()
+    except Exception as e:
+        print(f"Warm-up error: {str(e)}")
+
+app = FastAPI(title="LUMA API", description="API for LUMA - Luminous AI Search", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -17,15 +48,59 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "Retry-After"],
 )
 
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    # Shed load quickly and tell the client when to come back
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail},
+        headers={"Retry-After": str(max(1, int(exc.retry_after)))}
+    )
+
 # Include API routes
 app.include_router(router, prefix="/api")
 
+# Add a Server-Timing header with the per-stage breakdown of each API request
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING", "false").lower() in ("1", "true", "yes")
+API_ROUTES = {route.path for route in app.routes if route.path.startswith("/api")}
+
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    path = request.url.path
+    if not path.startswith("/api"):
+        return await call_next(request)
+    
+    # Unknown paths share one label so the metric stays bounded
+    route = path if path in API_ROUTES else "other"
+    timings = []
+    token = server_timings.set(timings)
+    REQUESTS_IN_FLIGHT.inc(route=route)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        elapsed = time.perf_counter() - start
+        REQUESTS_IN_FLIGHT.dec(route=route)
+        REQUEST_SECONDS.observe(elapsed, route=route, status=str(status))
+        server_timings.reset(token)
+    
+    if SERVER_TIMING_ENABLED:
+        response.headers["Server-Timing"] = format_server_timing(timings + [("total", elapsed)])
+    return response
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to LUMA API. Go to /docs for API documentation."}
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"} 
\ No newline at end of file
+    return {"status": "healthy"}
+
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
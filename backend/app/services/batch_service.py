@@ -0,0 +1,82 @@
+import os
+import asyncio
+from app.api.models import SearchRequest, SearchResponse
+from app.utils.cache import make_key, normalize_query
+from typing import List, Dict, Any, AsyncIterator, Awaitable, Callable, Optional
+
+def request_key(request: SearchRequest) -> str:
+    """
+    Requests with the same key produce the same response.
+    """
+    return make_key(normalize_query(request.query), list(dict.fromkeys(request.ai_model_ids)), request.num_results)
+
+class BatchService:
+    def __init__(self, run_search: Callable[[SearchRequest], Awaitable[SearchResponse]]):
+        # The single-request pipeline each query is run through
+        self.run_search = run_search
+        
+        # Batch limits: queries per batch, and queries of one batch in flight
+        # at once (callers may ask for fewer)
+        self.max_requests = int(os.getenv("BATCH_MAX_REQUESTS", "500"))
+        self.max_concurrency = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+        
+        # Queries of all batches together in flight at once. Each batch holds
+        # one admission slot, so without this many concurrent batches would
+        # run far more pipelines than the admission limit allows
+        self.global_concurrency = int(os.getenv("BATCH_GLOBAL_CONCURRENCY", "8"))
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    async def run(self, requests: List[SearchRequest], concurrency: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Run many search requests, yielding each result as soon as it is ready.
+        
+        Results are dicts with the request's index and either a "response" or
+        an "error", in completion order. Identical requests in the batch run
+        once. Pages shared between queries are fetched once by ContentService.
+        """
+        limit = min(concurrency or self.max_concurrency, self.max_concurrency)
+        semaphore = asyncio.Semaphore(max(1, limit))
+        shared = self._get_semaphore()
+        
+        # Identical requests share one run
+        indexes: Dict[str, List[int]] = {}
+        unique: Dict[str, SearchRequest] = {}
+        for index, request in enumerate(requests):
+            key = request_key(request)
+            indexes.setdefault(key, []).append(index)
+            unique.setdefault(key, request)
+        
+        async def run_one(key: str):
+            async with semaphore, shared:
+                return key, await self.run_search(unique[key])
+        
+        tasks = {asyncio.create_task(run_one(key)): key for key in unique}
+        try:
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    key = tasks[task]
+                    error = task.exception()
+                    for index in indexes[key]:
+                        if error is not None:
+                            detail = getattr(error, "detail", None) or str(error)
+                            yield {"index": index, "query": requests[index].query, "error": detail}
+                        else:
+                            response = task.result()[1]
+                            if response.query != requests[index].query:
+                                response = response.model_copy(update={"query": requests[index].query})
+                            yield {"index": index, "response": response}
+        finally:
+            # Stop the remaining queries when the caller goes away
+            for task in tasks:
+                task.cancel()
+    
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # One semaphore per event loop, like the admission controller's
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(max(1, self.global_concurrency))
+            self._loop = loop
+        return self._semaphore
@@ -1,112 +1,345 @@
-import aiohttp
-from bs4 import BeautifulSoup
-from app.api.models import SearchResult
-from app.utils.cache import cache
-from typing import List, Dict
-import re
-import trafilatura
+import os
+import asyncio
+import time
+import weakref
+from app.services.context_service import Source
+from app.services.search_service import WebResult
+from app.utils.cache import cache, make_key, Codec
+from app.utils.http_client import http_client
+from app.utils.extraction import ExtractionPool
+from app.utils.fingerprint import simhash, hamming_distance
+from app.utils.metrics import PAGE_FETCH_SECONDS, PAGE_STORE_LOOKUPS, BLOCKED_DOMAINS, DUPLICATE_SOURCES
+from app.utils.page_store import PageStore, StoredPage
+from typing import List, Dict, Optional, Tuple, AsyncIterator
 from urllib.parse import urlparse
 
+def _sources_key(results: List[WebResult]) -> str:
+    return make_key([result.url for result in results])
+
+# Sources are stored as [url, title, snippet, text] rows in shared backends
+SOURCES_CODEC = Codec(
+    lambda sources: [[source.url, source.title, source.snippet, source.text] for source in sources],
+    lambda rows: [Source(*row) for row in rows]
+)
+
 class ContentService:
-    @cache(ttl=3600)  # Cache content for 1 hour
-    async def extract_content(self, results: List[SearchResult], max_chars: int = 10000) -> str:
+    def __init__(self):
+        # Fetch stage limits: concurrent downloads per extraction, downloads per
+        # host across all extractions and a deadline (seconds) shared by all
+        # downloads of one extraction
+        self.max_concurrency = int(os.getenv("CONTENT_MAX_CONCURRENCY", "8"))
+        self.per_host_limit = int(os.getenv("CONTENT_PER_HOST_LIMIT", "2"))
+        self.fetch_deadline = float(os.getenv("CONTENT_FETCH_DEADLINE", "8"))
+        # Pipelined mode: analysis starts once min_pages pages are extracted or
+        # time_budget seconds have passed, instead of waiting for every page
+        self.pipelined = os.getenv("CONTENT_PIPELINED", "false").lower() in ("1", "true", "yes")
+        self.min_pages = int(os.getenv("CONTENT_MIN_PAGES", "3"))
+        self.time_budget = float(os.getenv("CONTENT_TIME_BUDGET", "2.5"))
+        # Upper bound on the text kept per page; passages are picked from it later
+        self.page_max_chars = int(os.getenv("CONTENT_PAGE_MAX_CHARS", "20000"))
+        # Pages whose SimHash fingerprints differ in at most this many of 64
+        # bits are copies of each other (syndicated articles, mirrors); -1
+        # keeps them all
+        self.duplicate_distance = int(os.getenv("CONTENT_DUPLICATE_DISTANCE", "3"))
+        
+        # Download limits per page: only HTML is read, at most max_page_bytes of
+        # it (the rest is dropped), within read_deadline seconds
+        self.html_content_types = ("text/html", "application/xhtml+xml")
+        self.max_page_bytes = int(os.getenv("CONTENT_MAX_PAGE_BYTES", str(1024 * 1024)))
+        self.read_deadline = float(os.getenv("CONTENT_READ_DEADLINE", "5"))
+        self.read_chunk_bytes = 64 * 1024
+        
+        # Extracted pages are reused across queries for PAGE_FRESH_SECONDS and
+        # revalidated with the origin after that
+        self.page_store = PageStore(
+            fresh_for=float(os.getenv("PAGE_FRESH_SECONDS", "3600")),
+            keep_for=float(os.getenv("PAGE_KEEP_SECONDS", str(7 * 24 * 3600))),
+            max_entries=int(os.getenv("PAGE_STORE_MAX_ENTRIES", "1000"))
+        )
+        
+        # HTML parsing is CPU-bound, so keep it off the event loop: in worker
+        # processes ("process"), in threads ("thread") or, by default, in
+        # processes when there is more than one core ("auto")
+        self.extraction_pool = ExtractionPool(
+            mode=os.getenv("CONTENT_EXTRACT_MODE", "auto"),
+            workers=int(os.getenv("CONTENT_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1)))),
+            max_tasks_per_child=int(os.getenv("CONTENT_EXTRACT_MAX_TASKS_PER_CHILD", "200")),
+            cpu_limit=float(os.getenv("CONTENT_EXTRACT_CPU_LIMIT", "5"))
+        )
+        
+        # Downloads in flight by URL and per-host limits, shared by all queries
+        self._page_flights: Dict[str, asyncio.Task] = {}
+        self._page_waiters: Dict[str, int] = {}
+        self._host_semaphores: "weakref.WeakValueDictionary[str, asyncio.Semaphore]" = weakref.WeakValueDictionary()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        
+        self.blocked_domains = ['facebook.com', 'twitter.com', 'instagram.com', 'linkedin.com']
+    
+    @cache(ttl=3600, key=_sources_key, codec=SOURCES_CODEC)  # Cache content for 1 hour
+    async def extract_sources(self, results: List[WebResult]) -> List[Source]:
         """
-        Extract content from the top search results to provide context for AI models.
+        Extract the main text of the top search results' pages.
+        
+        Returns one Source per result, in rank order, leaving out pages that
+        copy a higher-ranked one. Pages that are blocked, fail or miss the
+        fetch deadline keep an empty text and only contribute their snippet to
+        the context.
         """
-        all_content = []
-        total_chars = 0
+        urls = [result.url for result in results if not self._is_blocked(result.url)]
+        pages = await self._fetch_all(urls)
         
-        # If we have no results or can't extract content, provide a fallback
-        if not results:
-            return "No search results were found for this query."
+        return self._drop_duplicates([
+            Source(result.url, result.title, result.snippet, pages.get(result.url, ""))
+            for result in results
+        ])
+    
+    async def gather_sources(self, results: List[WebResult]) -> List[Source]:
+        """
+        Extract the pages of the top search results for the model context.
         
-        # First, add the snippets from the search results
-        for result in results:
-            all_content.append(f"Source: {result.url}\nTitle: {result.title}\nSummary: {result.snippet}\n")
-            total_chars += len(result.snippet)
+        In pipelined mode this returns as soon as min_pages pages have text or
+        time_budget seconds have passed, cancelling the downloads still
+        running, so that one slow site cannot hold up the analysis. Otherwise
+        it waits for every page, up to the fetch deadline.
+        """
+        if not self.pipelined:
+            return await self.extract_sources(results)
         
-        # Try to extract more content from the web pages
-        async with aiohttp.ClientSession() as session:
-            for result in results:
-                if total_chars >= max_chars:
+        urls = [result.url for result in results if not self._is_blocked(result.url)]
+        pages = {}
+        page_iterator = self._iter_pages(urls, min(self.fetch_deadline, self.time_budget))
+        try:
+            async for url, text in page_iterator:
+                if text:
+                    pages[url] = text
+                if len(pages) >= self.min_pages:
                     break
-                    
-                try:
-                    # Skip certain domains that are likely to block scraping
-                    domain = urlparse(result.url).netloc
-                    if any(blocked in domain for blocked in ['facebook.com', 'twitter.com', 'instagram.com', 'linkedin.com']):
-                        continue
-                        
-                    content = await self._fetch_and_extract(session, result.url)
-                    # Limit content per page to ensure we get a mix of sources
-                    content = content[:2000]
-                    
-                    if content:
-                        all_content.append(f"Additional content from {result.url}:\n{content}\n")
-                        total_chars += len(content)
-                except Exception as e:
-                    # Skip this result if there's an error
-                    print(f"Error extracting content from {result.url}: {str(e)}")
+        finally:
+            await page_iterator.aclose()
+        
+        return self._drop_duplicates([
+            Source(result.url, result.title, result.snippet, pages.get(result.url, ""))
+            for result in results
+        ])
+    
+    def _drop_duplicates(self, sources: List[Source]) -> List[Source]:
+        """
+        Drop sources whose page text is a near-copy of a higher-ranked
+        source's, so that their share of the context goes to distinct pages.
+        """
+        if self.duplicate_distance < 0:
+            return sources
+        
+        distinct = []
+        fingerprints = []
+        for source in sources:
+            fingerprint = simhash(source.text) if source.text else None
+            if fingerprint is not None:
+                if any(hamming_distance(fingerprint, other) <= self.duplicate_distance for other in fingerprints):
+                    DUPLICATE_SOURCES.inc(kind="content")
                     continue
+                fingerprints.append(fingerprint)
+            distinct.append(source)
+        return distinct
+    
+    def _is_blocked(self, url: str) -> bool:
+        """
+        Skip certain domains that are likely to block scraping.
+        """
+        domain = urlparse(url).netloc
+        for blocked in self.blocked_domains:
+            if blocked in domain:
+                BLOCKED_DOMAINS.inc(domain=blocked)
+                return True
+        return False
+    
+    async def _fetch_all(self, urls: List[str]) -> Dict[str, str]:
+        """
+        Fetch and extract several pages concurrently under a shared deadline.
+        
+        Pages that fail or are still downloading when the deadline passes are
+        left out of the returned mapping.
+        """
+        return {url: text async for url, text in self._iter_pages(urls, self.fetch_deadline)}
+    
+    async def _iter_pages(self, urls: List[str], deadline: float) -> AsyncIterator[Tuple[str, str]]:
+        """
+        Fetch and extract pages concurrently, yielding (url, text) pairs as
+        they complete until deadline seconds have passed.
+        
+        Downloads still running when the deadline passes or the caller stops
+        iterating are cancelled.
+        """
+        if not urls:
+            return
+        
+        semaphore = asyncio.Semaphore(self.max_concurrency)
         
-        return "\n\n".join(all_content)
+        async def fetch(url: str) -> str:
+            async with semaphore:
+                return await self._fetch_shared(url)
+        
+        tasks = {asyncio.create_task(fetch(url)): url for url in dict.fromkeys(urls)}
+        loop = asyncio.get_running_loop()
+        end = loop.time() + deadline
+        pending = set(tasks)
+        try:
+            while pending:
+                remaining = end - loop.time()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        print(f"Error extracting content from {tasks[task]}: {str(task.exception())}")
+                        continue
+                    yield tasks[task], task.result()
+        finally:
+            for task in pending:
+                task.cancel()
     
-    async def _fetch_and_extract(self, session: aiohttp.ClientSession, url: str) -> str:
+    async def _fetch_shared(self, url: str) -> str:
+        """
+        Fetch and extract a page, joining a download of the same URL that is
+        already running for another query.
+        
+        Downloads are limited per host across all queries, so concurrent
+        searches that return the same sites do not hammer them.
+        """
+        self._bind_loop()
+        task = self._page_flights.get(url)
+        if task is None:
+            task = asyncio.create_task(self._fetch_limited(url))
+            self._page_flights[url] = task
+            self._page_waiters[url] = 0
+            task.add_done_callback(lambda finished: self._finish_flight(url, finished))
+        
+        # Shielded so that one query giving up does not cancel it for the
+        # others; the download is cancelled once every query has given up
+        self._page_waiters[url] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if self._page_flights.get(url) is task:
+                self._page_waiters[url] -= 1
+                if self._page_waiters[url] == 0 and not task.done():
+                    task.cancel()
+    
+    async def _fetch_limited(self, url: str) -> str:
+        host = urlparse(url).netloc
+        host_semaphore = self._host_semaphores.get(host)
+        if host_semaphore is None:
+            host_semaphore = self._host_semaphores[host] = asyncio.Semaphore(self.per_host_limit)
+        async with host_semaphore:
+            return await self._fetch_and_extract(url)
+    
+    def _finish_flight(self, url: str, task: asyncio.Task):
+        if self._page_flights.get(url) is task:
+            del self._page_flights[url]
+            del self._page_waiters[url]
+        if not task.cancelled():
+            task.exception()
+    
+    def _bind_loop(self):
+        # Downloads and semaphores belong to one event loop
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._page_flights = {}
+            self._page_waiters = {}
+            self._host_semaphores = weakref.WeakValueDictionary()
+            self._loop = loop
+    
+    async def _fetch_and_extract(self, url: str) -> str:
         """
         Fetch a web page and extract its main content.
+        
+        Extractions are kept per URL in the page store. A fresh stored page is
+        returned without a request; a stale one is revalidated with its ETag or
+        Last-Modified validator and reused if the server answers 304.
         """
+        stored = await self.page_store.get(url)
+        if stored is not None and self.page_store.is_fresh(stored):
+            PAGE_STORE_LOOKUPS.inc(outcome="fresh")
+            return stored.text
+        
         try:
             headers = {
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
                 'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
                 'Accept-Language': 'en-US,en;q=0.5',
             }
+            if stored is not None:
+                if stored.etag:
+                    headers['If-None-Match'] = stored.etag
+                if stored.last_modified:
+                    headers['If-Modified-Since'] = stored.last_modified
             
-            async with session.get(url, headers=headers, timeout=10) as response:
-                if response.status != 200:
-                    return ""
-                
-                html = await response.text()
-                
-                # Try using trafilatura first (better at extracting main content)
-                extracted = trafilatura.extract(html, include_comments=False, include_tables=True)
-                if extracted:
-                    return extracted
+            session = http_client.get_session()
+            with PAGE_FETCH_SECONDS.time(outcome="error") as labels:
+                async with session.get(url, headers=headers, timeout=http_client.timeout("content")) as response:
+                    if response.status == 304 and stored is not None:
+                        labels["outcome"] = "not_modified"
+                        PAGE_STORE_LOOKUPS.inc(outcome="revalidated")
+                        stored.fetched_at = time.time()
+                        await self.page_store.put(stored)
+                        return stored.text
                     
-                # Fall back to BeautifulSoup if trafilatura fails
-                return self._extract_main_content(html)
+                    if response.status != 200:
+                        labels["outcome"] = "http_error"
+                        return self._stale_text(stored)
+                    
+                    if not self._is_html(response):
+                        labels["outcome"] = "not_html"
+                        return self._stale_text(stored)
+                    
+                    try:
+                        body, truncated = await asyncio.wait_for(self._read_body(response), timeout=self.read_deadline)
+                    except asyncio.TimeoutError:
+                        labels["outcome"] = "read_timeout"
+                        return self._stale_text(stored)
+                    encoding = response.charset
+                    etag = response.headers.get("ETag")
+                    last_modified = response.headers.get("Last-Modified")
+                    labels["outcome"] = "truncated" if truncated else "ok"
+                
+            text = (await self.extraction_pool.extract(body, encoding))[:self.page_max_chars]
+            
+            PAGE_STORE_LOOKUPS.inc(outcome="miss" if stored is None else "changed")
+            if text:
+                await self.page_store.put(StoredPage(url, text, etag, last_modified, time.time()))
+            return text
         except Exception as e:
             print(f"Error fetching {url}: {str(e)}")
-            return ""
+            return self._stale_text(stored)
     
-    def _extract_main_content(self, html: str) -> str:
+    def _is_html(self, response) -> bool:
+        """
+        Accept HTML responses, and responses that do not declare a type.
         """
-        Extract the main content from an HTML page, removing navigation, ads, etc.
+        return "Content-Type" not in response.headers or response.content_type in self.html_content_types
+    
+    async def _read_body(self, response) -> Tuple[bytes, bool]:
         """
-        soup = BeautifulSoup(html, 'html.parser')
+        Stream a response body into a buffer of at most max_page_bytes.
         
-        # Remove script, style, and other non-content elements
-        for element in soup(['script', 'style', 'header', 'footer', 'nav', 'aside', 'iframe', 'noscript']):
-            element.decompose()
-            
-        # Remove common ad and navigation class names
-        for element in soup.find_all(class_=re.compile('(ad|banner|menu|sidebar|footer|header|nav|comment)')):
-            element.decompose()
-        
-        # Try to find the main content
-        main_content = None
-        for tag in ['main', 'article', 'div[role="main"]', '.main-content', '#content', '#main']:
-            main_content = soup.select_one(tag)
-            if main_content:
+        Returns the raw bytes and whether the body was cut short. A cut body
+        is not read any further and its connection is dropped.
+        """
+        buffer = bytearray()
+        truncated = False
+        async for chunk in response.content.iter_chunked(self.read_chunk_bytes):
+            buffer += chunk[:self.max_page_bytes - len(buffer)]
+            if len(buffer) >= self.max_page_bytes:
+                truncated = True
+                response.close()
                 break
-                
-        if main_content:
-            text = main_content.get_text(separator=' ', strip=True)
-        else:
-            # If no main content found, use the body
-            text = soup.get_text(separator=' ', strip=True)
-        
-        # Clean up whitespace
-        text = re.sub(r'\s+', ' ', text).strip()
-        
-        return text 
\ No newline at end of file
+        return bytes(buffer), truncated
+    
+    def _stale_text(self, stored: Optional[StoredPage]) -> str:
+        """
+        Fall back to a stale stored page when a refetch fails.
+        """
+        if stored is None:
+            return ""
+        PAGE_STORE_LOOKUPS.inc(outcome="stale")
+        return stored.text
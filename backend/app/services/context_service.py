@@ -0,0 +1,198 @@
+import os
+import math
+import re
+import zlib
+from collections import Counter
+from typing import List, Set
+from app.utils.lazy import optional_module
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough LLM token count: about four characters per token for English text.
+    """
+    return (len(text) + 3) // 4
+
+class Source:
+    """
+    One search result together with the text extracted from its page.
+    """
+    __slots__ = ("url", "title", "snippet", "text")
+
+    def __init__(self, url: str, title: str, snippet: str, text: str = ""):
+        self.url = url
+        self.title = title
+        self.snippet = snippet
+        self.text = text
+
+class Passage:
+    """
+    A chunk of a source's page text, scored against the query.
+    """
+    __slots__ = ("rank", "position", "text", "tokens", "score")
+
+    def __init__(self, rank: int, position: int, text: str):
+        self.rank = rank
+        self.position = position
+        self.text = text
+        self.tokens = estimate_tokens(text)
+        self.score = 0.0
+
+class ContextBuilder:
+    """
+    Builds the model context from extracted pages: splits them into passages,
+    scores the passages against the query with BM25, and packs the best ones
+    into a token budget, skipping near-identical passages from other sources.
+    """
+    # BM25 parameters
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        self.passage_chars = int(os.getenv("CONTEXT_PASSAGE_CHARS", "600"))
+        # Jaccard similarity of word trigrams above which passages are duplicates
+        self.duplicate_threshold = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.7"))
+
+    def build(self, query: str, sources: List[Source], token_budget: int) -> str:
+        """
+        Assemble the context for one model within token_budget tokens.
+        """
+        if not sources:
+            return "No search results were found for this query."
+
+        # The snippets always go in: they are short and cover every source
+        headers = [
+            ("Source: ", source.url, "\nTitle: ", source.title, "\nSummary: ", source.snippet, "\n")
+            for source in sources
+        ]
+        budget = token_budget - sum(estimate_tokens(part) for header in headers for part in header)
+
+        passages = self.split(sources)
+        self.score(query, passages)
+        selected = self.pack(passages, budget)
+
+        # Present the selected passages grouped by source, in rank and page order
+        excerpts: List[List[str]] = [[] for _ in sources]
+        for passage in sorted(selected, key=lambda p: (p.rank, p.position)):
+            excerpts[passage.rank].append(passage.text)
+
+        # Collect the pieces and join once, rather than concatenating each
+        # section and then joining the sections
+        pieces: List[str] = []
+        for header, source_excerpts in zip(headers, excerpts):
+            if pieces:
+                pieces.append("\n\n")
+            pieces.extend(header)
+            if source_excerpts:
+                pieces.append("Relevant excerpts:\n")
+                for i, excerpt in enumerate(source_excerpts):
+                    if i:
+                        pieces.append("\n...\n")
+                    pieces.append(excerpt)
+                pieces.append("\n")
+        return "".join(pieces)
+
+    def split(self, sources: List[Source]) -> List[Passage]:
+        """
+        Split every source's page text into passages of about passage_chars,
+        keeping paragraphs together where possible.
+        """
+        passages = []
+        for rank, source in enumerate(sources):
+            position = 0
+            current = ""
+            for paragraph in self._paragraphs(source.text):
+                if current and len(current) + len(paragraph) + 1 > self.passage_chars:
+                    passages.append(Passage(rank, position, current))
+                    position += 1
+                    current = ""
+                current = f"{current}\n{paragraph}" if current else paragraph
+            if current:
+                passages.append(Passage(rank, position, current))
+        return passages
+
+    def score(self, query: str, passages: List[Passage]):
+        """
+        Set each passage's BM25 score for the query terms.
+        """
+        terms = list(dict.fromkeys(TOKEN_PATTERN.findall(query.lower())))
+        if not passages or not terms:
+            return
+
+        lengths = []
+        frequencies = []
+        for passage in passages:
+            words = TOKEN_PATTERN.findall(passage.text.lower())
+            counts = Counter(words)
+            lengths.append(len(words))
+            frequencies.append([counts.get(term, 0) for term in terms])
+
+        np = optional_module("numpy")
+        if np is not None:
+            tf = np.array(frequencies, dtype=np.float32)
+            length = np.array(lengths, dtype=np.float32)
+            containing = (tf > 0).sum(axis=0)
+            idf = np.log(1 + (len(passages) - containing + 0.5) / (containing + 0.5))
+            norm = self.K1 * (1 - self.B + self.B * length / max(float(length.mean()), 1.0))
+            scores = (idf * tf * (self.K1 + 1) / (tf + norm[:, None])).sum(axis=1)
+            for passage, value in zip(passages, scores.tolist()):
+                passage.score = value
+            return
+
+        average = max(sum(lengths) / len(lengths), 1.0)
+        idf = []
+        for column in range(len(terms)):
+            containing = sum(1 for row in frequencies if row[column])
+            idf.append(math.log(1 + (len(passages) - containing + 0.5) / (containing + 0.5)))
+        for passage, row, length in zip(passages, frequencies, lengths):
+            norm = self.K1 * (1 - self.B + self.B * length / average)
+            passage.score = sum(w * f * (self.K1 + 1) / (f + norm) for w, f in zip(idf, row))
+
+    def pack(self, passages: List[Passage], budget: int) -> List[Passage]:
+        """
+        Greedily take the best-scoring passages that fit the budget. Passages
+        that match no query term are only used as the lead of their page.
+        """
+        selected = []
+        selected_shingles: List[Set[int]] = []
+        for passage in sorted(passages, key=lambda p: (-p.score, p.rank, p.position)):
+            if passage.tokens > budget:
+                continue
+            if passage.score <= 0 and passage.position > 0:
+                continue
+
+            shingles = self._shingles(passage.text)
+            if any(self._similarity(shingles, other) >= self.duplicate_threshold for other in selected_shingles):
+                continue
+
+            selected.append(passage)
+            selected_shingles.append(shingles)
+            budget -= passage.tokens
+        return selected
+
+    def _paragraphs(self, text: str) -> List[str]:
+        paragraphs = []
+        for paragraph in text.split("\n"):
+            paragraph = paragraph.strip()
+            while len(paragraph) > self.passage_chars:
+                # Break long paragraphs at the last sentence or word boundary
+                cut = paragraph.rfind(". ", 0, self.passage_chars)
+                if cut <= 0:
+                    cut = paragraph.rfind(" ", 0, self.passage_chars)
+                if cut <= 0:
+                    cut = self.passage_chars - 1
+                paragraphs.append(paragraph[:cut + 1].strip())
+                paragraph = paragraph[cut + 1:].strip()
+            if paragraph:
+                paragraphs.append(paragraph)
+        return paragraphs
+
+    def _shingles(self, text: str) -> Set[int]:
+        words = TOKEN_PATTERN.findall(text.lower())
+        return {zlib.crc32(" ".join(words[i:i + 3]).encode("utf-8")) for i in range(max(len(words) - 2, 1))}
+
+    def _similarity(self, a: Set[int], b: Set[int]) -> float:
+        if not a or not b:
+            return 0.0
+        return len(a & b) / len(a | b)
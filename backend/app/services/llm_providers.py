@@ -0,0 +1,305 @@
+import os
+import asyncio
+import json
+import random
+import time
+import aiohttp
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Dict, List, Optional
+from app.utils.http_client import http_client
+from app.utils.metrics import LLM_RETRIES
+
+# HTTP statuses worth retrying: rate limits and transient server errors
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+class ProviderError(Exception):
+    """
+    A failed provider call. retry_after is the delay the provider asked for,
+    in seconds, if it sent one.
+    """
+    def __init__(self, message: str, retryable: bool = False, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+class ModelSpec:
+    """
+    One entry of the model registry.
+    """
+    __slots__ = ("id", "name", "provider", "description", "api", "api_model", "context_window")
+
+    def __init__(
+        self,
+        id: str,
+        name: str,
+        provider: str,
+        description: str,
+        api: str,
+        api_model: str,
+        context_window: int = 8192
+    ):
+        self.id = id
+        self.name = name
+        # Display name of the provider, e.g. "Google"
+        self.provider = provider
+        self.description = description
+        # Key of the Provider that serves the model and the model's name there
+        self.api = api
+        self.api_model = api_model
+        self.context_window = context_window
+
+def load_model_registry(path: Optional[str] = None) -> List[ModelSpec]:
+    """
+    Load the available models from LLM_MODELS_FILE, by default models.json
+    next to this package.
+    """
+    path = path or os.getenv(
+        "LLM_MODELS_FILE", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models.json")
+    )
+    with open(path, encoding="utf-8") as f:
+        return [ModelSpec(**entry) for entry in json.load(f)]
+
+class Provider:
+    """
+    Base class for an LLM API client.
+
+    Calls go through the shared HTTP session, at most max_concurrency at a
+    time, and failed calls that are worth retrying are retried up to
+    max_retries times with jittered exponential backoff, or after the delay
+    the provider asked for in Retry-After when that is not too long.
+    Connection errors are retried too.
+    """
+    name = ""
+    label = ""
+
+    def __init__(self, api_key: Optional[str], max_concurrency: int = 8, max_retries: int = 2,
+                 backoff_base: float = 0.5, backoff_max: float = 8):
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def complete(self, model: str, prompt: str) -> str:
+        """
+        Return the model's full response to the prompt.
+        """
+        attempt = 0
+        while True:
+            try:
+                async with self._get_semaphore():
+                    return await self._complete(model, prompt)
+            except ProviderError as e:
+                error = e
+            except aiohttp.ClientError as e:
+                error = ProviderError(f"Error calling {self.label} API: {str(e)}", retryable=True)
+            await self._before_retry(error, attempt)
+            attempt += 1
+
+    async def stream(self, model: str, prompt: str) -> AsyncIterator[str]:
+        """
+        Yield the model's response as it is generated. Only failures before
+        the first chunk are retried.
+        """
+        attempt = 0
+        while True:
+            started = False
+            try:
+                async with self._get_semaphore():
+                    async for chunk in self._stream(model, prompt):
+                        started = True
+                        yield chunk
+                return
+            except ProviderError as e:
+                error = e
+            except aiohttp.ClientError as e:
+                error = ProviderError(f"Error calling {self.label} API: {str(e)}", retryable=True)
+            if started:
+                raise error
+            await self._before_retry(error, attempt)
+            attempt += 1
+
+    async def _complete(self, model: str, prompt: str) -> str:
+        raise NotImplementedError
+
+    def _stream(self, model: str, prompt: str) -> AsyncIterator[str]:
+        raise NotImplementedError
+
+    async def _before_retry(self, error: ProviderError, attempt: int):
+        """
+        Sleep before the next attempt, or re-raise if the call should not be retried.
+        """
+        if not error.retryable or attempt >= self.max_retries:
+            raise error
+        if error.retry_after is not None:
+            # Waiting longer than the backoff cap would blow the model timeout
+            if error.retry_after > self.backoff_max:
+                raise error
+            delay = error.retry_after
+        else:
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        LLM_RETRIES.inc(provider=self.name)
+        await asyncio.sleep(delay)
+
+    async def _check(self, response):
+        """
+        Raise a ProviderError for an unsuccessful HTTP response.
+        """
+        if response.status == 200:
+            return
+        error_text = await response.text()
+        raise ProviderError(
+            f"Error from {self.label} API: {error_text}",
+            retryable=response.status in RETRYABLE_STATUSES,
+            retry_after=_retry_after(response.headers.get("Retry-After"))
+        )
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # One semaphore per event loop, like the shared HTTP session
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._semaphore
+
+class GroqProvider(Provider):
+    """
+    Groq's OpenAI-compatible chat completions API.
+    """
+    name = "groq"
+    label = "Groq"
+
+    def __init__(self, api_key: Optional[str], api_url: str, **limits):
+        super().__init__(api_key, **limits)
+        self.api_url = api_url
+
+    def _request(self, model: str, prompt: str, stream: bool) -> Dict:
+        payload = {
+            "messages": [
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            "model": model
+        }
+        if stream:
+            payload["stream"] = True
+        return {
+            "headers": {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"},
+            "json": payload,
+            "timeout": http_client.timeout("llm")
+        }
+
+    async def _complete(self, model: str, prompt: str) -> str:
+        session = http_client.get_session()
+        async with session.post(self.api_url, **self._request(model, prompt, stream=False)) as response:
+            await self._check(response)
+            data = await response.json()
+            return data["choices"][0]["message"]["content"]
+
+    async def _stream(self, model: str, prompt: str) -> AsyncIterator[str]:
+        session = http_client.get_session()
+        async with session.post(self.api_url, **self._request(model, prompt, stream=True)) as response:
+            await self._check(response)
+            async for data in _sse_data(response):
+                if data == "[DONE]":
+                    break
+                delta = json.loads(data)["choices"][0].get("delta", {})
+                if delta.get("content"):
+                    yield delta["content"]
+
+class GeminiProvider(Provider):
+    """
+    Google's Gemini generateContent REST API, called directly on the shared
+    session rather than through the SDK.
+    """
+    name = "gemini"
+    label = "Gemini"
+
+    def __init__(self, api_key: Optional[str], api_base: str, **limits):
+        super().__init__(api_key, **limits)
+        self.api_base = api_base.rstrip("/")
+
+    def _request(self, prompt: str) -> Dict:
+        return {
+            "headers": {"x-goog-api-key": self.api_key or "", "Content-Type": "application/json"},
+            "json": {"contents": [{"role": "user", "parts": [{"text": prompt}]}]},
+            "timeout": http_client.timeout("llm")
+        }
+
+    async def _complete(self, model: str, prompt: str) -> str:
+        session = http_client.get_session()
+        url = f"{self.api_base}/v1beta/models/{model}:generateContent"
+        async with session.post(url, **self._request(prompt)) as response:
+            await self._check(response)
+            return _gemini_text(await response.json())
+
+    async def _stream(self, model: str, prompt: str) -> AsyncIterator[str]:
+        session = http_client.get_session()
+        url = f"{self.api_base}/v1beta/models/{model}:streamGenerateContent"
+        async with session.post(url, params={"alt": "sse"}, **self._request(prompt)) as response:
+            await self._check(response)
+            async for data in _sse_data(response):
+                text = _gemini_text(json.loads(data))
+                if text:
+                    yield text
+
+def _gemini_text(data: Dict) -> str:
+    candidates = data.get("candidates") or []
+    if not candidates:
+        # Blocked prompts come back without candidates
+        reason = data.get("promptFeedback", {}).get("blockReason", "no candidates returned")
+        raise ProviderError(f"Error from Gemini API: {reason}")
+    parts = candidates[0].get("content", {}).get("parts", [])
+    return "".join(part.get("text", "") for part in parts)
+
+async def _sse_data(response) -> AsyncIterator[str]:
+    """
+    Yield the data field of each Server-Sent Event in a response.
+    """
+    async for line in response.content:
+        line = line.decode("utf-8").strip()
+        if line.startswith("data:"):
+            yield line[len("data:"):].strip()
+
+def _retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header given in seconds or as an HTTP date.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def create_providers() -> Dict[str, Provider]:
+    """
+    Build the provider clients from the environment, keyed by name.
+    """
+    limits = {
+        "max_retries": int(os.getenv("LLM_MAX_RETRIES", "2")),
+        "backoff_base": float(os.getenv("LLM_BACKOFF_BASE", "0.5")),
+        "backoff_max": float(os.getenv("LLM_BACKOFF_MAX", "8")),
+    }
+    return {
+        "gemini": GeminiProvider(
+            os.getenv("GEMINI_API_KEY"),
+            os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com"),
+            max_concurrency=int(os.getenv("GEMINI_MAX_CONCURRENCY", "8")),
+            **limits
+        ),
+        "groq": GroqProvider(
+            os.getenv("GROQ_API_KEY"),
+            os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions"),
+            max_concurrency=int(os.getenv("GROQ_MAX_CONCURRENCY", "8")),
+            **limits
+        ),
+    }
@@ -1,41 +1,99 @@
 import os
-import google.generativeai as genai
-import groq
+import asyncio
+import time
 from app.api.models import AIAnalysis, ModelInfo
-from typing import List, Dict
-import json
-import aiohttp
-from app.utils.cache import cache
+from typing import List, Dict, AsyncIterator
+import hashlib
+from app.services.llm_providers import ProviderError, create_providers, load_model_registry
+from app.services.context_service import ContextBuilder, Source, estimate_tokens
+from app.utils.cache import cache, make_key, normalize_query, Codec
+from app.utils.answer_index import QueryIndex
+from app.utils.health import HealthTracker
+from app.utils.metrics import LLM_CALL_SECONDS, ANSWER_SEMANTIC_HITS
+
+# How long model analyses are reused (seconds)
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "3600"))
+
+# Prompt template around the query and the search results, kept in pieces so
+# that prompts are assembled with a single join
+PROMPT_TEMPLATE = """
+        You are a helpful AI assistant tasked with analyzing search results and providing a comprehensive answer to a user's query.
+        
+        USER QUERY: {query}
+        
+        SEARCH RESULTS:
+        {content}
+        
+        Please analyze the search results and provide a detailed, informative response to the user's query. Your response should:
+        
+        1. Directly address the user's query with the most relevant information from the search results
+        2. Be well-structured, using markdown formatting for readability
+        3. Any additional context that might be helpful
+        
+        If the search results don't contain enough information to answer the query, 
+        please indicate what's missing and provide the best response you can with the available information.
+        
+        Format your response in markdown for readability.
+        """
+PROMPT_HEAD, _rest = PROMPT_TEMPLATE.split("{query}")
+PROMPT_MIDDLE, PROMPT_TAIL = _rest.split("{content}")
+PROMPT_OVERHEAD_TOKENS = estimate_tokens(PROMPT_HEAD + PROMPT_MIDDLE + PROMPT_TAIL)
+
+def _content_fingerprint(content: str) -> str:
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
+
+def _analysis_key(query: str, content: str, ai_model_id: str) -> str:
+    return make_key(ai_model_id, normalize_query(query), _content_fingerprint(content))
+
+class AnalysisFailed(Exception):
+    """
+    Raised by LLMService._analyze when no answer was produced, so that the
+    failure is not cached. The message is shown in place of the answer.
+    """
+
+ANALYSIS_CODEC = Codec(
+    lambda analysis: [analysis.ai_model_id, analysis.content],
+    lambda row: AIAnalysis(ai_model_id=row[0], content=row[1])
+)
 
 class LLMService:
     def __init__(self):
-        # Initialize Google Gemini
-        self.gemini_api_key = os.getenv("GEMINI_API_KEY")
-        if self.gemini_api_key:
-            genai.configure(api_key=self.gemini_api_key)
-        else:
+        # Provider clients, with endpoints overridable to point at local
+        # stand-ins (GEMINI_API_BASE, GROQ_API_URL)
+        self.providers = create_providers()
+        if not os.getenv("GEMINI_API_KEY"):
             print("WARNING: GEMINI_API_KEY not found in environment variables")
-        
-        # Initialize Groq
-        self.groq_api_key = os.getenv("GROQ_API_KEY")
-        if not self.groq_api_key:
+        if not os.getenv("GROQ_API_KEY"):
             print("WARNING: GROQ_API_KEY not found in environment variables")
         
-        # Define available models
+        # Available models, from the registry file (LLM_MODELS_FILE)
+        self.registry = {spec.id: spec for spec in load_model_registry()}
         self.models = [
-            ModelInfo(
-                id="gemini-pro",
-                name="Gemini 2.0 Flash",
-                provider="Google",
-                description="Google's Gemini 2.0 Flash model for general text generation and analysis."
-            ),
-            ModelInfo(
-                id="llama3-70b-8192",
-                name="Llama 3 70B",
-                provider="Groq",
-                description="Meta's Llama 3 70B model, optimized for speed on Groq's platform."
-            )
+            ModelInfo(id=spec.id, name=spec.name, provider=spec.provider, description=spec.description)
+            for spec in self.registry.values()
         ]
+        
+        # Near-duplicate answer lookup for rephrasings of a query over the same
+        # search content. Off by default; a threshold below 1 turns it on.
+        self.answer_index = QueryIndex(
+            threshold=float(os.getenv("ANSWER_SIMILARITY_THRESHOLD", "1")),
+            capacity=int(os.getenv("ANSWER_INDEX_SIZE", "512")),
+            ttl=ANSWER_CACHE_TTL
+        )
+        
+        # Fan-out limits for multi-model analysis (seconds)
+        self.model_timeout = float(os.getenv("LLM_MODEL_TIMEOUT", "25"))
+        self.total_deadline = float(os.getenv("LLM_TOTAL_DEADLINE", "30"))
+        
+        # Context assembly: every prompt is capped at context_max_tokens, and
+        # smaller models also keep response_reserve tokens free for the answer
+        self.context_builder = ContextBuilder()
+        self.context_max_tokens = int(os.getenv("CONTEXT_MAX_TOKENS", "3000"))
+        self.response_reserve = int(os.getenv("LLM_RESPONSE_RESERVE", "1024"))
+        
+        # Circuit breakers per provider, so calls to a provider that keeps
+        # failing return at once instead of waiting out the model timeout
+        self.provider_health = HealthTracker("llm", sorted({spec.api for spec in self.registry.values()}))
     
     def get_available_models(self) -> List[ModelInfo]:
         """
@@ -46,88 +104,199 @@ class LLMService:
     async def analyze(self, query: str, content: str, ai_model_id: str) -> AIAnalysis:
         """
         Analyze the search results using the specified AI model.
+        
+        Answers are cached by model, normalized query and content fingerprint.
+        When enabled, an answer to a recent rephrasing of the query over the
+        same content is reused first; such answers are not cached again.
         """
+        similar = self.answer_index.lookup(ai_model_id, query, _content_fingerprint(content))
+        if similar is not None:
+            ANSWER_SEMANTIC_HITS.inc(model=ai_model_id)
+            return AIAnalysis(ai_model_id=ai_model_id, content=similar)
+        
+        try:
+            return await self._analyze(query, content, ai_model_id)
+        except AnalysisFailed as e:
+            return AIAnalysis(ai_model_id=ai_model_id, content=str(e))
+    
+    @cache(ttl=ANSWER_CACHE_TTL, key=_analysis_key, codec=ANALYSIS_CODEC)
+    async def _analyze(self, query: str, content: str, ai_model_id: str) -> AIAnalysis:
+        """
+        Analyze the search results with the model's provider. Raises
+        AnalysisFailed when there is no answer.
+        """
+        spec = self.registry.get(ai_model_id)
+        if spec is None:
+            raise AnalysisFailed(f"Error: Unsupported model ID '{ai_model_id}'")
+        
+        health = self.provider_health.get(spec.api)
+        permit = health.allow()
+        if permit is None:
+            raise AnalysisFailed(self._unavailable_analysis(ai_model_id, spec.api).content)
+        
         prompt = self._generate_prompt(query, content)
         
-        if ai_model_id == "gemini-pro":
-            response = await self._call_gemini(prompt)
-        elif ai_model_id in ["llama3-70b-8192"]:
-            response = await self._call_groq(prompt, ai_model_id)
-        else:
-            response = f"Error: Unsupported model ID '{ai_model_id}'"
+        start = time.perf_counter()
+        with LLM_CALL_SECONDS.time(timing=f"llm-{ai_model_id}", model=ai_model_id, outcome="error") as labels:
+            error = None
+            try:
+                response = await self.providers[spec.api].complete(spec.api_model, prompt)
+            except ProviderError as e:
+                error = str(e)
+            except asyncio.CancelledError:
+                labels["outcome"] = "cancelled"
+                health.record_cancelled(permit)
+                raise
+            except Exception as e:
+                error = f"Error calling {spec.provider} API: {str(e)}"
+            labels["outcome"] = "error" if error is not None else "ok"
+        
+        if error is not None:
+            health.record_failure(time.perf_counter() - start)
+            raise AnalysisFailed(error)
+        
+        health.record_success(time.perf_counter() - start)
+        self.answer_index.add(ai_model_id, query, _content_fingerprint(content), response)
         
         return AIAnalysis(
             ai_model_id=ai_model_id,
             content=response
         )
     
-    def _generate_prompt(self, query: str, content: str) -> str:
+    async def analyze_stream(self, query: str, content: str, ai_model_id: str) -> AsyncIterator[str]:
         """
-        Generate a prompt for the AI model.
+        Analyze the search results with the specified AI model, yielding the
+        response text incrementally as the provider streams it.
         """
-        return f"""
-        You are a helpful AI assistant tasked with analyzing search results and providing a comprehensive answer to a user's query.
+        spec = self.registry.get(ai_model_id)
+        if spec is None:
+            yield f"Error: Unsupported model ID '{ai_model_id}'"
+            return
         
-        USER QUERY: {query}
+        health = self.provider_health.get(spec.api)
+        permit = health.allow()
+        if permit is None:
+            yield self._unavailable_analysis(ai_model_id, spec.api).content
+            return
         
-        SEARCH RESULTS:
-        {content}
+        prompt = self._generate_prompt(query, content)
         
-        Please analyze the search results and provide a detailed, informative response to the user's query. Your response should:
+        # The provider is judged on whether the stream starts with an answer
+        start = time.perf_counter()
+        first = True
+        try:
+            async for chunk in self.providers[spec.api].stream(spec.api_model, prompt):
+                if first:
+                    health.record_success(time.perf_counter() - start)
+                first = False
+                yield chunk
+        except ProviderError as e:
+            if first:
+                health.record_failure(time.perf_counter() - start)
+                first = False
+            yield str(e)
+        except Exception as e:
+            if first:
+                health.record_failure(time.perf_counter() - start)
+                first = False
+            yield f"Error calling {spec.provider} API: {str(e)}"
+        finally:
+            if first:
+                health.record_cancelled(permit)
+    
+    def context_budget(self, query: str, ai_model_id: str) -> int:
+        """
+        Token budget for the search results in a prompt to the given model.
+        """
+        spec = self.registry.get(ai_model_id)
+        window = spec.context_window if spec is not None else 8192
+        overhead = PROMPT_OVERHEAD_TOKENS + estimate_tokens(query) + self.response_reserve
+        return max(0, min(self.context_max_tokens, window - overhead))
+    
+    def build_context(self, query: str, sources: List[Source], ai_model_id: str) -> str:
+        """
+        Pack the passages most relevant to the query into the model's budget.
+        """
+        return self.context_builder.build(query, sources, self.context_budget(query, ai_model_id))
+    
+    async def analyze_all(self, query: str, sources: List[Source], ai_model_ids: List[str]) -> Dict[str, AIAnalysis]:
+        """
+        Analyze the search results with several models concurrently.
         
-        1. Directly address the user's query with the most relevant information from the search results
-        2. Be well-structured, using markdown formatting for readability
-        3. Any additional context that might be helpful
+        Each model gets a context sized to its budget, its own timeout, and all
+        of them share one total deadline. Models that do not finish in time are
+        returned marked as timed out.
+        """
+        # Preserve the requested order and drop duplicate model IDs
+        ai_model_ids = list(dict.fromkeys(ai_model_ids))
+        if not ai_model_ids:
+            return {}
         
-        If the search results don't contain enough information to answer the query, 
-        please indicate what's missing and provide the best response you can with the available information.
+        # Models with the same budget share one context
+        contexts: Dict[int, str] = {}
+        for ai_model_id in ai_model_ids:
+            budget = self.context_budget(query, ai_model_id)
+            if budget not in contexts:
+                contexts[budget] = self.context_builder.build(query, sources, budget)
         
-        Format your response in markdown for readability.
+        model_timeout = min(self.model_timeout, self.total_deadline)
+        tasks = {
+            asyncio.create_task(
+                asyncio.wait_for(
+                    self.analyze(query, contexts[self.context_budget(query, ai_model_id)], ai_model_id),
+                    timeout=model_timeout
+                )
+            ): ai_model_id
+            for ai_model_id in ai_model_ids
+        }
+        
+        done, pending = await asyncio.wait(tasks, timeout=self.total_deadline)
+        for task in pending:
+            task.cancel()
+        
+        analyses = {}
+        for task, ai_model_id in tasks.items():
+            if task in done and not task.cancelled():
+                error = task.exception()
+                if error is None:
+                    analyses[ai_model_id] = task.result()
+                elif isinstance(error, asyncio.TimeoutError):
+                    # A provider that hangs is as broken as one that errors
+                    spec = self.registry.get(ai_model_id)
+                    if spec is not None:
+                        self.provider_health.get(spec.api).record_failure(model_timeout)
+                    analyses[ai_model_id] = self._timed_out_analysis(ai_model_id, model_timeout)
+                else:
+                    analyses[ai_model_id] = AIAnalysis(
+                        ai_model_id=ai_model_id,
+                        content=f"Error analyzing with '{ai_model_id}': {str(error)}"
+                    )
+            else:
+                analyses[ai_model_id] = self._timed_out_analysis(ai_model_id, self.total_deadline)
+        
+        return analyses
+    
+    def _timed_out_analysis(self, ai_model_id: str, timeout: float) -> AIAnalysis:
+        """
+        Build the placeholder analysis for a model that missed its deadline.
         """
+        return AIAnalysis(
+            ai_model_id=ai_model_id,
+            content=f"Error: '{ai_model_id}' did not respond within {timeout:g} seconds",
+            timed_out=True
+        )
     
-    async def _call_gemini(self, prompt: str) -> str:
+    def _unavailable_analysis(self, ai_model_id: str, provider: str) -> AIAnalysis:
         """
-        Call the Google Gemini API.
+        Build the placeholder analysis for a model whose provider circuit is open.
         """
-        try:
-            model = genai.GenerativeModel('gemini-2.0-flash')
-            response = await model.generate_content_async(prompt)
-            return response.text
-        except Exception as e:
-            return f"Error calling Gemini API: {str(e)}"
+        return AIAnalysis(
+            ai_model_id=ai_model_id,
+            content=f"Error: '{ai_model_id}' is temporarily unavailable because {provider} keeps failing"
+        )
     
-    async def _call_groq(self, prompt: str, model_id: str) -> str:
+    def _generate_prompt(self, query: str, content: str) -> str:
         """
-        Call the Groq API.
+        Generate a prompt for the AI model.
         """
-        try:
-            # Use HTTP API directly instead of the client library to avoid version issues
-            headers = {
-                "Authorization": f"Bearer {self.groq_api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            payload = {
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                "model": model_id
-            }
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    "https://api.groq.com/openai/v1/chat/completions", 
-                    headers=headers, 
-                    json=payload
-                ) as response:
-                    if response.status != 200:
-                        error_text = await response.text()
-                        return f"Error from Groq API: {error_text}"
-                    
-                    data = await response.json()
-                    return data["choices"][0]["message"]["content"]
-        except Exception as e:
-            return f"Error calling Groq API: {str(e)}" 
\ No newline at end of file
+        return "".join((PROMPT_HEAD, query, PROMPT_MIDDLE, content, PROMPT_TAIL))
@@ -1,13 +1,52 @@
-import aiohttp
-from bs4 import BeautifulSoup
-from app.api.models import SearchResult
-from app.utils.cache import cache
-from typing import List
+import os
+import asyncio
+import time
+from app.utils.cache import cache, make_key, normalize_query, Codec
+from app.utils.http_client import http_client
+from app.utils.health import HealthTracker, Permit
+from app.utils.html_parser import get_html_parser
+from app.utils.metrics import SEARCH_ENGINE_SECONDS, SEARCH_ENGINE_FALLBACKS, DUPLICATE_SOURCES
+from app.utils.urls import canonicalize_url, url_key
+from typing import List, Optional
 import urllib.parse
 import random
 import json
 import re
 
+# Results per search when a request leaves num_results out or null
+DEFAULT_NUM_RESULTS = 5
+
+def resolve_num_results(num_results: Optional[int]) -> int:
+    return DEFAULT_NUM_RESULTS if num_results is None else num_results
+
+def _search_key(query: str, num_results: Optional[int] = DEFAULT_NUM_RESULTS) -> str:
+    return make_key(normalize_query(query), resolve_num_results(num_results))
+
+class WebResult:
+    """
+    One search engine result. Converted to the API's SearchResult model only
+    when a response is built.
+    """
+    __slots__ = ("title", "url", "snippet")
+    
+    def __init__(self, title: str, url: str, snippet: str):
+        self.title = title
+        self.url = url
+        self.snippet = snippet
+
+# Placeholder results returned when every engine failed start with this URL
+FALLBACK_URL = "https://www.google.com/search?q="
+
+def _is_found(results: List[WebResult]) -> bool:
+    # Keep fallback results out of the cache so the next request searches again
+    return not any(result.url.startswith(FALLBACK_URL) for result in results)
+
+# Search results are stored as [title, url, snippet] rows in shared backends
+SEARCH_RESULTS_CODEC = Codec(
+    lambda results: [[result.title, result.url, result.snippet] for result in results],
+    lambda rows: [WebResult(*row) for row in rows]
+)
+
 class SearchService:
     def __init__(self):
         self.user_agents = [
@@ -16,215 +55,391 @@ class SearchService:
             "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.107 Safari/537.36"
         ]
         
-    @cache(ttl=3600)  # Cache results for 1 hour
-    async def search(self, query: str, num_results: int = 5) -> List[SearchResult]:
+        # Engine endpoints, overridable to point at local stand-ins
+        self.google_url = os.getenv("SEARCH_GOOGLE_URL", "https://www.google.com/search")
+        self.bing_url = os.getenv("SEARCH_BING_URL", "https://www.bing.com/search")
+        self.ddg_url = os.getenv("SEARCH_DDG_URL", "https://html.duckduckgo.com/html/")
+        
+        # Fast C-backed parser by default, BeautifulSoup as a fallback
+        self.html_parser = get_html_parser()
+        
+        # Engines in order of preference
+        self.engines = {
+            "google": self._search_with_google,
+            "bing": self._search_with_bing,
+            "ddg": self._search_with_ddg
+        }
+        
+        # Circuit breakers per engine. With SEARCH_ADAPTIVE_ORDER the healthy
+        # engines are tried cheapest first (latency / success rate) instead of
+        # in the fixed order above.
+        self.health = HealthTracker(
+            "search",
+            list(self.engines),
+            adaptive=os.getenv("SEARCH_ADAPTIVE_ORDER", "true").lower() in ("1", "true", "yes")
+        )
+        
+        # How engines are combined: "sequential" (next engine only after the
+        # previous one failed), "hedge" (also start the next engine after
+        # hedge_delay seconds) or "race" (start all engines at once)
+        self.strategy = os.getenv("SEARCH_STRATEGY", "hedge")
+        self.hedge_delay = float(os.getenv("SEARCH_HEDGE_DELAY", "1.5"))
+        
+        # Merge and deduplicate the results of every engine instead of taking
+        # the first good result set
+        self.merge_results = os.getenv("SEARCH_MERGE_RESULTS", "false").lower() in ("1", "true", "yes")
+        
+        # Extra results parsed per engine, to fill the slots of results that
+        # turn out to be copies of others (mobile, AMP or tracking URL variants)
+        self.spare_results = int(os.getenv("SEARCH_SPARE_RESULTS", "3"))
+        
+    @cache(ttl=3600, key=_search_key, codec=SEARCH_RESULTS_CODEC, condition=_is_found)  # Cache results for 1 hour
+    async def search(self, query: str, num_results: Optional[int] = DEFAULT_NUM_RESULTS) -> List[WebResult]:
         """
         Perform a search and return the results.
         """
+        # SearchRequest.num_results may be null
+        num_results = resolve_num_results(num_results)
+        
         # Try multiple search engines
+        limit = num_results + self.spare_results
         try:
-            # First try Google
-            google_results = await self._search_with_google(query, num_results)
-            if google_results and len(google_results) > 0:
-                return google_results
-                
-            # Then try Bing
-            bing_results = await self._search_with_bing(query, num_results)
-            if bing_results and len(bing_results) > 0:
-                return bing_results
-                
-            # Finally, use DuckDuckGo
-            ddg_results = await self._search_with_ddg(query, num_results)
-            if ddg_results and len(ddg_results) > 0:
-                return ddg_results
+            if self.strategy == "race":
+                results = await self._search_hedged(query, limit, hedge_delay=0)
+            elif self.strategy == "hedge":
+                results = await self._search_hedged(query, limit, hedge_delay=self.hedge_delay)
+            else:
+                results = await self._search_hedged(query, limit, hedge_delay=None)
+            
+            if results:
+                return self._distinct(results, num_results)
         except Exception as e:
             print(f"Search error: {str(e)}")
             
         # If all search engines fail, return fallback results
         return self._generate_fallback_results(query, num_results)
     
-    async def _search_with_google(self, query: str, num_results: int) -> List[SearchResult]:
+    async def _search_hedged(self, query: str, num_results: int, hedge_delay: Optional[float]) -> List[WebResult]:
+        """
+        Query the engines in order of preference, starting the next one as soon as
+        the current one fails or hedge_delay seconds pass without an answer.
+        
+        The first non-empty result set wins and the engines still running are
+        cancelled. With merge_results, every engine runs to completion and the
+        result sets are merged. A hedge_delay of None only moves on after a failure.
+        """
+        remaining = self.health.order()
+        running = set()
+        ranks = {}
+        result_sets = {}
+        
+        def start_next(reason: Optional[str]):
+            name, permit = remaining.pop(0)
+            if reason:
+                SEARCH_ENGINE_FALLBACKS.inc(engine=name, reason=reason)
+            task = asyncio.create_task(self._timed_search(name, permit, query, num_results))
+            ranks[task] = len(ranks)
+            running.add(task)
+        
+        try:
+            while running or remaining:
+                if not running:
+                    start_next("merge" if ranks else None)
+                
+                done, running = await asyncio.wait(
+                    running,
+                    timeout=hedge_delay if remaining else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                
+                failed = False
+                for task in done:
+                    results = task.result() if task.exception() is None else []
+                    if not results:
+                        failed = True
+                    elif self.merge_results:
+                        result_sets[ranks[task]] = results
+                    else:
+                        return results
+                
+                # Hedge when the engines in flight are slow or one of them failed
+                if remaining and (failed or not done):
+                    start_next("failure" if failed else "hedge")
+        finally:
+            for task in running:
+                task.cancel()
+            # Engines never started give back any probe claimed for them
+            for name, permit in remaining:
+                self.health.get(name).record_cancelled(permit)
+        
+        return self._merge(
+            [result_sets[rank] for rank in sorted(result_sets)],
+            num_results
+        )
+    
+    async def _timed_search(self, name: str, permit: Permit, query: str, num_results: int) -> List[WebResult]:
+        """
+        Run one engine, recording its latency and outcome.
+        
+        Empty result sets count as failures for the engine's circuit breaker:
+        blocked or CAPTCHA pages parse to no results.
+        """
+        health = self.health.get(name)
+        start = time.perf_counter()
+        with SEARCH_ENGINE_SECONDS.time(timing=f"search-{name}", engine=name, outcome="error") as labels:
+            try:
+                results = await self.engines[name](query, num_results)
+            except asyncio.CancelledError:
+                labels["outcome"] = "cancelled"
+                health.record_cancelled(permit)
+                raise
+            except Exception:
+                health.record_failure(time.perf_counter() - start)
+                raise
+            labels["outcome"] = "ok" if results else "empty"
+            
+        if results:
+            health.record_success(time.perf_counter() - start)
+        else:
+            health.record_failure(time.perf_counter() - start)
+        return results
+    
+    def _merge(self, result_sets: List[List[WebResult]], num_results: int) -> List[WebResult]:
+        """
+        Interleave result sets in engine order, dropping duplicate URLs.
+        """
+        merged = []
+        seen = set()
+        for position in range(max((len(results) for results in result_sets), default=0)):
+            for results in result_sets:
+                if position >= len(results):
+                    continue
+                result = results[position]
+                key = url_key(result.url)
+                if key in seen:
+                    continue
+                seen.add(key)
+                merged.append(result)
+        return merged[:num_results]
+    
+    def _distinct(self, results: List[WebResult], num_results: int) -> List[WebResult]:
+        """
+        Canonicalize result URLs and drop results that point at a page already
+        in the list, keeping the first num_results.
+        """
+        distinct = []
+        seen = set()
+        for result in results:
+            key = url_key(result.url)
+            if key in seen:
+                DUPLICATE_SOURCES.inc(kind="url")
+                continue
+            seen.add(key)
+            distinct.append(WebResult(result.title, canonicalize_url(result.url), result.snippet))
+            if len(distinct) >= num_results:
+                break
+        return distinct
+    
+    async def _search_with_google(self, query: str, num_results: int) -> List[WebResult]:
         """
         Search using Google
         """
         try:
-            async with aiohttp.ClientSession() as session:
-                headers = {
-                    'User-Agent': random.choice(self.user_agents),
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                    'Accept-Language': 'en-US,en;q=0.5',
-                }
+            session = http_client.get_session()
+            headers = {
+                'User-Agent': random.choice(self.user_agents),
+                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+                'Accept-Language': 'en-US,en;q=0.5',
+            }
+            
+            url = f"{self.google_url}?q={urllib.parse.quote(query)}&num={num_results+5}"
+            
+            async with session.get(url, headers=headers, timeout=http_client.timeout("search")) as response:
+                if response.status != 200:
+                    return []
                 
-                url = f"https://www.google.com/search?q={urllib.parse.quote(query)}&num={num_results+5}"
+                html = await response.text()
                 
-                async with session.get(url, headers=headers) as response:
-                    if response.status != 200:
-                        return []
-                    
-                    html = await response.text()
-                    
-                    # Parse the HTML response
-                    soup = BeautifulSoup(html, 'html.parser')
-                    
-                    results = []
-                    # Google search results are in divs with class 'g'
-                    for div in soup.select('div.g'):
-                        # Find the title and URL
-                        title_element = div.select_one('h3')
-                        if not title_element:
-                            continue
-                            
-                        title = title_element.get_text(strip=True)
-                        
-                        # Find the URL
-                        url_element = div.select_one('a')
-                        if not url_element:
-                            continue
-                            
-                        url = url_element.get('href', '')
-                        if url.startswith('/url?q='):
-                            url = url.split('/url?q=')[1].split('&')[0]
-                        elif not url.startswith('http'):
-                            continue
-                        
-                        # Find the snippet
-                        snippet_element = div.select_one('div.VwiC3b')
-                        snippet = snippet_element.get_text(strip=True) if snippet_element else ""
-                        
-                        results.append(SearchResult(
-                            title=title,
-                            url=url,
-                            snippet=snippet
-                        ))
-                        
-                        if len(results) >= num_results:
-                            break
-                    
-                    return results
+                return self._parse_google(html, num_results)
         except Exception as e:
             print(f"Google search error: {str(e)}")
             return []
     
-    async def _search_with_bing(self, query: str, num_results: int) -> List[SearchResult]:
+    async def _search_with_bing(self, query: str, num_results: int) -> List[WebResult]:
         """
         Search using Bing
         """
         try:
-            async with aiohttp.ClientSession() as session:
-                headers = {
-                    'User-Agent': random.choice(self.user_agents),
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                    'Accept-Language': 'en-US,en;q=0.5',
-                }
+            session = http_client.get_session()
+            headers = {
+                'User-Agent': random.choice(self.user_agents),
+                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+                'Accept-Language': 'en-US,en;q=0.5',
+            }
+            
+            url = f"{self.bing_url}?q={urllib.parse.quote(query)}&count={num_results+5}"
+            
+            async with session.get(url, headers=headers, timeout=http_client.timeout("search")) as response:
+                if response.status != 200:
+                    return []
                 
-                url = f"https://www.bing.com/search?q={urllib.parse.quote(query)}&count={num_results+5}"
+                html = await response.text()
                 
-                async with session.get(url, headers=headers) as response:
-                    if response.status != 200:
-                        return []
-                    
-                    html = await response.text()
-                    
-                    # Parse the HTML response
-                    soup = BeautifulSoup(html, 'html.parser')
-                    
-                    results = []
-                    # Bing search results are in li elements with class 'b_algo'
-                    for li in soup.select('li.b_algo'):
-                        # Find the title and URL
-                        title_element = li.select_one('h2 a')
-                        if not title_element:
-                            continue
-                            
-                        title = title_element.get_text(strip=True)
-                        url = title_element.get('href', '')
-                        
-                        # Find the snippet
-                        snippet_element = li.select_one('p')
-                        snippet = snippet_element.get_text(strip=True) if snippet_element else ""
-                        
-                        results.append(SearchResult(
-                            title=title,
-                            url=url,
-                            snippet=snippet
-                        ))
-                        
-                        if len(results) >= num_results:
-                            break
-                    
-                    return results
+                return self._parse_bing(html, num_results)
         except Exception as e:
             print(f"Bing search error: {str(e)}")
             return []
     
-    async def _search_with_ddg(self, query: str, num_results: int) -> List[SearchResult]:
+    async def _search_with_ddg(self, query: str, num_results: int) -> List[WebResult]:
         """
         Search using DuckDuckGo
         """
         try:
-            async with aiohttp.ClientSession() as session:
-                headers = {
-                    'User-Agent': random.choice(self.user_agents),
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                    'Accept-Language': 'en-US,en;q=0.5',
-                }
+            session = http_client.get_session()
+            headers = {
+                'User-Agent': random.choice(self.user_agents),
+                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+                'Accept-Language': 'en-US,en;q=0.5',
+            }
+            
+            url = f"{self.ddg_url}?q={urllib.parse.quote(query)}"
+            
+            async with session.get(url, headers=headers, timeout=http_client.timeout("search")) as response:
+                if response.status != 200:
+                    return []
                 
-                url = f"https://html.duckduckgo.com/html/?q={urllib.parse.quote(query)}"
+                html = await response.text()
                 
-                async with session.get(url, headers=headers) as response:
-                    if response.status != 200:
-                        return []
-                    
-                    html = await response.text()
-                    
-                    # Parse the HTML response
-                    soup = BeautifulSoup(html, 'html.parser')
-                    
-                    results = []
-                    # DuckDuckGo search results are in divs with class 'result'
-                    for div in soup.select('.result'):
-                        # Find the title and URL
-                        title_element = div.select_one('.result__title a')
-                        if not title_element:
-                            continue
-                            
-                        title = title_element.get_text(strip=True)
-                        
-                        # Find the URL
-                        url = title_element.get('href', '')
-                        if url.startswith('/'):
-                            url_parts = urllib.parse.urlparse(url)
-                            query_params = urllib.parse.parse_qs(url_parts.query)
-                            if 'uddg' in query_params:
-                                url = query_params['uddg'][0]
-                        
-                        # Find the snippet
-                        snippet_element = div.select_one('.result__snippet')
-                        snippet = snippet_element.get_text(strip=True) if snippet_element else ""
-                        
-                        results.append(SearchResult(
-                            title=title,
-                            url=url,
-                            snippet=snippet
-                        ))
-                        
-                        if len(results) >= num_results:
-                            break
-                    
-                    return results
+                return self._parse_ddg(html, num_results)
         except Exception as e:
             print(f"DuckDuckGo search error: {str(e)}")
             return []
     
-    def _generate_fallback_results(self, query: str, num_results: int) -> List[SearchResult]:
+    def _parse_google(self, html: str, num_results: int) -> List[WebResult]:
+        """
+        Parse a Google results page
+        """
+        # Parse the HTML response
+        document = self.html_parser.parse(html)
+        
+        results = []
+        # Google search results are in divs with class 'g'
+        for div in document.select('div.g'):
+            # Find the title and URL
+            title_element = div.select_one('h3')
+            if not title_element:
+                continue
+                
+            title = title_element.get_text(strip=True)
+            
+            # Find the URL
+            url_element = div.select_one('a')
+            if not url_element:
+                continue
+                
+            url = url_element.get('href', '')
+            if url.startswith('/url?q='):
+                url = url.split('/url?q=')[1].split('&')[0]
+            elif not url.startswith('http'):
+                continue
+            
+            # Find the snippet
+            snippet_element = div.select_one('div.VwiC3b')
+            snippet = snippet_element.get_text(strip=True) if snippet_element else ""
+            
+            results.append(WebResult(
+                title=title,
+                url=url,
+                snippet=snippet
+            ))
+            
+            if len(results) >= num_results:
+                break
+        
+        return results
+    
+    def _parse_bing(self, html: str, num_results: int) -> List[WebResult]:
+        """
+        Parse a Bing results page
+        """
+        # Parse the HTML response
+        document = self.html_parser.parse(html)
+        
+        results = []
+        # Bing search results are in li elements with class 'b_algo'
+        for li in document.select('li.b_algo'):
+            # Find the title and URL
+            title_element = li.select_one('h2 a')
+            if not title_element:
+                continue
+                
+            title = title_element.get_text(strip=True)
+            url = title_element.get('href', '')
+            
+            # Find the snippet
+            snippet_element = li.select_one('p')
+            snippet = snippet_element.get_text(strip=True) if snippet_element else ""
+            
+            results.append(WebResult(
+                title=title,
+                url=url,
+                snippet=snippet
+            ))
+            
+            if len(results) >= num_results:
+                break
+        
+        return results
+    
+    def _parse_ddg(self, html: str, num_results: int) -> List[WebResult]:
+        """
+        Parse a DuckDuckGo results page
+        """
+        # Parse the HTML response
+        document = self.html_parser.parse(html)
+        
+        results = []
+        # DuckDuckGo search results are in divs with class 'result'
+        for div in document.select('.result'):
+            # Find the title and URL
+            title_element = div.select_one('.result__title a')
+            if not title_element:
+                continue
+                
+            title = title_element.get_text(strip=True)
+            
+            # Find the URL
+            url = title_element.get('href', '')
+            if url.startswith('/'):
+                url_parts = urllib.parse.urlparse(url)
+                query_params = urllib.parse.parse_qs(url_parts.query)
+                if 'uddg' in query_params:
+                    url = query_params['uddg'][0]
+            
+            # Find the snippet
+            snippet_element = div.select_one('.result__snippet')
+            snippet = snippet_element.get_text(strip=True) if snippet_element else ""
+            
+            results.append(WebResult(
+                title=title,
+                url=url,
+                snippet=snippet
+            ))
+            
+            if len(results) >= num_results:
+                break
+        
+        return results
+    
+    def _generate_fallback_results(self, query: str, num_results: int) -> List[WebResult]:
         """
         Generate fallback results when all search engines fail.
         """
         # Create a more informative fallback result
         return [
-            SearchResult(
+            WebResult(
                 title=f"Search for: {query}",
-                url=f"https://www.google.com/search?q={urllib.parse.quote(query)}",
+                url=f"{FALLBACK_URL}{urllib.parse.quote(query)}",
                 snippet=f"We couldn't find specific information about '{query}'. This might be because the topic is very new, specialized, or not widely documented online. Try refining your search or checking specialized sources."
             )
         ] 
\ No newline at end of file
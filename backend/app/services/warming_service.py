@@ -0,0 +1,185 @@
+import os
+import asyncio
+import json
+import time
+from app.services.search_service import SearchService, FALLBACK_URL, DEFAULT_NUM_RESULTS, resolve_num_results
+from app.services.content_service import ContentService
+from app.utils.admission import admission
+from app.utils.cache import normalize_query, refresh_cached, cached_expires_in
+from app.utils.heavy_hitters import HeavyHitters
+from app.utils.metrics import WARM_REFRESHES
+from typing import List, Dict, Any, Optional, Tuple
+
+class WarmingService:
+    def __init__(self, search_service: SearchService, content_service: ContentService):
+        self.search_service = search_service
+        self.content_service = content_service
+        
+        # The warmer runs every interval seconds and refreshes the search
+        # results and page extractions of the top_k most frequent recent
+        # queries plus the admin warm list, once they have less than
+        # refresh_ahead seconds left in the cache
+        self.enabled = os.getenv("WARM_ENABLED", "true").lower() in ("1", "true", "yes")
+        self.interval = float(os.getenv("WARM_INTERVAL", "60"))
+        self.top_k = int(os.getenv("WARM_TOP_K", "20"))
+        self.refresh_ahead = float(os.getenv("WARM_REFRESH_AHEAD", "600"))
+        # Queries seen fewer times than this are not worth warming
+        self.min_count = int(os.getenv("WARM_MIN_COUNT", "3"))
+        
+        # Live traffic comes first: at most concurrency refreshes at a time, and
+        # none while more than max_load of the admission slots are in use
+        self.concurrency = int(os.getenv("WARM_CONCURRENCY", "2"))
+        self.max_load = float(os.getenv("WARM_MAX_LOAD", "0.5"))
+        
+        # Query frequencies of recent traffic; counts halve every half_life seconds
+        self.tracker = HeavyHitters(
+            k=self.top_k * 2,
+            half_life=float(os.getenv("WARM_HALF_LIFE", "3600"))
+        )
+        self.warm_list: List[Tuple[str, int]] = self._load_warm_list(os.getenv("WARM_QUERIES_FILE"))
+        
+        self.last_run: Dict[str, Any] = {}
+        self._task: Optional[asyncio.Task] = None
+    
+    def record(self, query: str, num_results: Optional[int]):
+        """
+        Count one search request towards the query's popularity. A null
+        num_results counts towards the default, as in the search cache.
+        """
+        if self.enabled:
+            self.tracker.add(_item(query, resolve_num_results(num_results)))
+    
+    def set_warm_list(self, queries: List[Tuple[str, int]]):
+        """
+        Replace the admin warm list. Listed queries are kept warm whatever
+        their traffic.
+        """
+        self.warm_list = list(dict.fromkeys((normalize_query(query), num_results) for query, num_results in queries))
+    
+    def candidates(self) -> List[Tuple[str, int]]:
+        """
+        Queries to keep warm: the warm list first, then the most popular ones.
+        """
+        popular = [
+            _parse_item(item) for item, count in self.tracker.top(self.top_k) if count >= self.min_count
+        ]
+        return list(dict.fromkeys(self.warm_list + popular))
+    
+    async def start(self):
+        """
+        Start the warming loop. Called from the application startup hook.
+        """
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """
+        Stop the warming loop. Called from the application shutdown hook.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def run_once(self) -> Dict[str, Any]:
+        """
+        Refresh every candidate that is about to expire. Returns counts by outcome.
+        """
+        semaphore = asyncio.Semaphore(max(1, self.concurrency))
+        outcomes: Dict[str, int] = {}
+        
+        async def warm(query: str, num_results: int):
+            async with semaphore:
+                # Re-checked per query so that a burst of traffic pauses the run
+                if admission.load() > self.max_load:
+                    outcome = "deferred"
+                else:
+                    try:
+                        outcome = await self._warm(query, num_results)
+                    except Exception as e:
+                        print(f"Error warming '{query}': {str(e)}")
+                        outcome = "error"
+            WARM_REFRESHES.inc(outcome=outcome)
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        
+        start = time.perf_counter()
+        await asyncio.gather(*(warm(query, num_results) for query, num_results in self.candidates()))
+        self.last_run = {
+            "finished_at": time.time(),
+            "seconds": round(time.perf_counter() - start, 3),
+            "outcomes": outcomes,
+        }
+        return outcomes
+    
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "warm_list": [{"query": query, "num_results": num_results} for query, num_results in self.warm_list],
+            "popular": [
+                dict(zip(("query", "num_results"), _parse_item(item)), count=count)
+                for item, count in self.tracker.top(self.top_k)
+            ],
+            "last_run": self.last_run,
+        }
+    
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"Cache warming error: {str(e)}")
+    
+    async def _warm(self, query: str, num_results: int) -> str:
+        """
+        Refresh one query's search results and page extractions if they
+        expire within refresh_ahead seconds.
+        """
+        search = self.search_service.search
+        remaining = cached_expires_in(search, query, num_results)
+        if remaining is not None and remaining > self.refresh_ahead:
+            results = await search(query, num_results)
+            outcome = "fresh"
+        else:
+            results = await refresh_cached(search, query, num_results)
+            outcome = "refreshed"
+        if any(result.url.startswith(FALLBACK_URL) for result in results):
+            return "no_results"
+        
+        # New results may point at other pages; those are extracted here too
+        extract = self.content_service.extract_sources
+        remaining = cached_expires_in(extract, results)
+        if remaining is None or remaining <= self.refresh_ahead:
+            await refresh_cached(extract, results)
+            outcome = "refreshed"
+        return outcome
+    
+    def _load_warm_list(self, path: Optional[str]) -> List[Tuple[str, int]]:
+        """
+        Read a JSON list of queries, each a string or {"query", "num_results"}.
+        """
+        if not path:
+            return []
+        try:
+            with open(path, encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error loading warm list from {path}: {str(e)}")
+            return []
+        queries = []
+        for entry in entries:
+            if isinstance(entry, str):
+                queries.append((normalize_query(entry), DEFAULT_NUM_RESULTS))
+            else:
+                queries.append((normalize_query(entry["query"]), int(entry.get("num_results", DEFAULT_NUM_RESULTS))))
+        return list(dict.fromkeys(queries))
+
+def _item(query: str, num_results: int) -> str:
+    return f"{num_results}\t{normalize_query(query)}"
+
+def _parse_item(item: str) -> Tuple[str, int]:
+    num_results, query = item.split("\t", 1)
+    return query, int(num_results)
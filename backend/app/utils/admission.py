@@ -0,0 +1,149 @@
+import os
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional, Tuple
+from app.utils.metrics import ADMISSION_REJECTIONS, ADMISSION_WAITING
+
+class Overloaded(Exception):
+    """
+    Raised when a request is turned away. Rendered as an HTTP error with a
+    Retry-After header by the application's exception handler.
+    """
+    def __init__(self, status_code: int, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+class Admission:
+    """
+    A slot held by one admitted request. release() may be called more than once.
+    """
+    def __init__(self, controller: "AdmissionController", semaphore: asyncio.Semaphore):
+        self._controller = controller
+        self._semaphore = semaphore
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            if self._semaphore is self._controller._semaphore:
+                self._controller.active -= 1
+            self._semaphore.release()
+
+class AdmissionController:
+    """
+    Global cap on concurrently running pipelines with a bounded wait queue.
+
+    Requests beyond max_concurrent wait up to queue_timeout seconds for a slot;
+    when max_queue requests are already waiting, new ones are rejected at once.
+    Both rejections are 503s, so clients fail fast instead of piling up.
+    """
+    def __init__(self, max_concurrent: int = 32, max_queue: int = 64, queue_timeout: float = 5):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.waiting = 0
+        self.active = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def acquire(self) -> Admission:
+        """
+        Wait for a slot. Raises Overloaded if the queue is full or the wait times out.
+        """
+        semaphore = self._get_semaphore()
+        if not semaphore.locked():
+            await semaphore.acquire()
+            self.active += 1
+            return Admission(self, semaphore)
+
+        if self.waiting >= self.max_queue:
+            ADMISSION_REJECTIONS.inc(reason="queue_full")
+            raise Overloaded(503, "Server is busy, please retry shortly", self.queue_timeout)
+
+        self.waiting += 1
+        ADMISSION_WAITING.set(self.waiting)
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            ADMISSION_REJECTIONS.inc(reason="queue_timeout")
+            raise Overloaded(503, "Server is busy, please retry shortly", self.queue_timeout)
+        finally:
+            self.waiting -= 1
+            ADMISSION_WAITING.set(self.waiting)
+        self.active += 1
+        return Admission(self, semaphore)
+
+    @asynccontextmanager
+    async def admit(self) -> AsyncIterator[Admission]:
+        """
+        Hold a slot for the duration of the block.
+        """
+        admission = await self.acquire()
+        try:
+            yield admission
+        finally:
+            admission.release()
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # One semaphore per event loop, like the shared HTTP session
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+            self._loop = loop
+            self.active = 0
+        return self._semaphore
+
+    def load(self) -> float:
+        """
+        Fraction of the slots in use, above 1 when requests are queueing.
+        """
+        return (self.active + self.waiting) / self.max_concurrent
+
+class RateLimiter:
+    """
+    Per-client token buckets: each client may make burst requests at once and
+    rate requests per second on average. A rate of 0 disables the limit.
+    """
+    def __init__(self, rate: float = 1.0, burst: int = 10, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        # client -> (tokens, last refill time), least recently seen first
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def check(self, client: str):
+        """
+        Take a token from the client's bucket. Raises Overloaded (429) when empty.
+        """
+        if self.rate <= 0:
+            return
+
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(client, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - updated) * self.rate)
+        if tokens < 1:
+            self._buckets[client] = (tokens, now)
+            ADMISSION_REJECTIONS.inc(reason="rate_limited")
+            raise Overloaded(429, "Too many requests", math.ceil((1 - tokens) / self.rate))
+
+        self._buckets[client] = (tokens - 1, now)
+        while len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+
+# Shared by the search endpoints
+admission = AdmissionController(
+    max_concurrent=int(os.getenv("ADMISSION_MAX_CONCURRENT", "32")),
+    max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "64")),
+    queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "5"))
+)
+# Off by default: clients are told apart by address, which behind a proxy is
+# only meaningful with TRUST_FORWARDED_FOR set (see routes._client_id)
+rate_limiter = RateLimiter(
+    rate=float(os.getenv("RATE_LIMIT_RPS", "0")),
+    burst=int(os.getenv("RATE_LIMIT_BURST", "10"))
+)
@@ -0,0 +1,120 @@
+import re
+import time
+import zlib
+from typing import Dict, List, Optional
+from app.utils.cache import normalize_query
+from app.utils.lazy import optional_module
+
+# Words that do not change what a query asks for
+FUNCTION_WORDS = frozenset(
+    "a an the of in on at to for from by with about into and or is are was were be "
+    "do does did how what which who whom why when where can could should would will "
+    "i me my we you your it its this that these those there please".split()
+)
+
+class QueryIndex:
+    """
+    Near-duplicate lookup of recent answers by query similarity.
+
+    Queries are embedded as hashed character trigram and word vectors and kept
+    per model in a fixed-size ring buffer, so a lookup is one matrix-vector
+    product. Similarity alone cannot tell "capital of austria" from "capital
+    of australia", so an answer is only reused for a query built on the same
+    search content with the same content words in the same order; the vectors
+    only decide between such candidates. Needs NumPy; without it every lookup
+    misses. Off unless threshold is below 1.
+    """
+    def __init__(self, threshold: float = 1.0, capacity: int = 512, dims: int = 1024, ttl: float = 3600):
+        self.threshold = threshold
+        self.capacity = capacity
+        self.dims = dims
+        self.ttl = ttl
+        self._models: Dict[str, "_ModelIndex"] = {}
+
+    @property
+    def enabled(self) -> bool:
+        # NumPy is imported on first use rather than at startup
+        return self.threshold < 1 and optional_module("numpy") is not None
+
+    def lookup(self, model_id: str, query: str, fingerprint: str) -> Optional[str]:
+        """
+        Return a stored answer for a recent query close enough to this one,
+        answered from search content with the same fingerprint.
+        """
+        index = self._models.get(model_id)
+        if not self.enabled or index is None:
+            return None
+
+        normalized = normalize_query(query)
+        vector = self._embed(normalized)
+        if vector is None:
+            return None
+
+        similarities = index.vectors @ vector
+        similarities[index.expires_at <= time.monotonic()] = -1
+        terms = _content_words(normalized)
+        np = optional_module("numpy")
+        for position in np.argsort(similarities)[::-1][:4]:
+            if similarities[position] < self.threshold:
+                break
+            if index.fingerprints[position] == fingerprint and index.terms[position] == terms:
+                return index.answers[position]
+        return None
+
+    def add(self, model_id: str, query: str, fingerprint: str, answer: str):
+        """
+        Remember the answer a model gave for a query over the search content
+        with the given fingerprint.
+        """
+        if not self.enabled:
+            return
+
+        normalized = normalize_query(query)
+        vector = self._embed(normalized)
+        if vector is None:
+            return
+
+        index = self._models.get(model_id)
+        if index is None:
+            index = self._models[model_id] = _ModelIndex(self.capacity, self.dims)
+        index.add(vector, time.monotonic() + self.ttl, fingerprint, _content_words(normalized), answer)
+
+    def _embed(self, normalized: str):
+        features = [f"w:{word}" for word in normalized.split()]
+        padded = f" {normalized} "
+        features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        if not features:
+            return None
+
+        np = optional_module("numpy")
+        vector = np.zeros(self.dims, dtype=np.float32)
+        buckets = [zlib.crc32(feature.encode("utf-8")) % self.dims for feature in features]
+        np.add.at(vector, buckets, 1.0)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+class _ModelIndex:
+    """
+    Ring buffer of query vectors and answers for one model.
+    """
+    def __init__(self, capacity: int, dims: int):
+        np = optional_module("numpy")
+        self.vectors = np.zeros((capacity, dims), dtype=np.float32)
+        self.expires_at = np.zeros(capacity, dtype=np.float64)
+        self.fingerprints: List[Optional[str]] = [None] * capacity
+        self.terms: List[Optional[List[str]]] = [None] * capacity
+        self.answers: List[Optional[str]] = [None] * capacity
+        self.next = 0
+
+    def add(self, vector, expires_at: float, fingerprint: str, terms: List[str], answer: str):
+        position = self.next
+        self.vectors[position] = vector
+        self.expires_at[position] = expires_at
+        self.fingerprints[position] = fingerprint
+        self.terms[position] = terms
+        self.answers[position] = answer
+        self.next = (position + 1) % len(self.answers)
+
+def _content_words(normalized: str) -> List[str]:
+    # Numbers count as content words: "python 3.11 release" vs "python 3.12 release"
+    return [word for word in re.findall(r"\d+(?:\.\d+)*|\w+", normalized) if word not in FUNCTION_WORDS]
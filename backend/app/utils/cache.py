@@ -1,31 +1,624 @@
+import asyncio
 import functools
+import hashlib
+import inspect
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
 import time
-from typing import Any, Callable, Dict, Tuple
+import zlib
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from urllib.parse import urlparse
+from app.utils.metrics import metrics
 
-# Simple in-memory cache
-cache_store: Dict[Tuple, Tuple[Any, float]] = {}
+class CacheEntry:
+    __slots__ = ("value", "expires_at", "size")
 
-def cache(ttl: int = 3600):
+    def __init__(self, value: Any, expires_at: float, size: int):
+        self.value = value
+        self.expires_at = expires_at
+        self.size = size
+
+class CacheStore:
+    """
+    In-memory LRU cache with TTL expiry, a global entry and byte budget and
+    optional per-namespace entry limits.
+    """
+    # Scan the whole store for expired entries once every this many writes
+    PURGE_INTERVAL = 256
+
+    def __init__(self, max_entries: int = 2048, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+
+        # Global recency order and a per-namespace recency order of the same keys
+        self._entries: "OrderedDict[Tuple[str, Hashable], CacheEntry]" = OrderedDict()
+        self._namespaces: Dict[str, "OrderedDict[Hashable, None]"] = {}
+        self._namespace_limits: Dict[str, int] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._writes = 0
+
+    def set_namespace_limit(self, namespace: str, max_entries: int):
+        """
+        Cap the number of entries a single namespace may hold.
+        """
+        self._namespace_limits[namespace] = max_entries
+
+    def get(self, namespace: str, key: Hashable) -> Tuple[bool, Any]:
+        """
+        Look up a key. Returns a (found, value) tuple.
+        """
+        stats = self._namespace_stats(namespace)
+        entry = self._entries.get((namespace, key))
+        if entry is None:
+            stats["misses"] += 1
+            return False, None
+
+        if entry.expires_at <= time.monotonic():
+            self._remove(namespace, key)
+            stats["expirations"] += 1
+            stats["misses"] += 1
+            return False, None
+
+        self._entries.move_to_end((namespace, key))
+        self._namespaces[namespace].move_to_end(key)
+        stats["hits"] += 1
+        return True, entry.value
+
+    def expires_in(self, namespace: str, key: Hashable) -> Optional[float]:
+        """
+        Seconds until a key expires, or None if it is not cached. Does not
+        count as a lookup.
+        """
+        entry = self._entries.get((namespace, key))
+        if entry is None:
+            return None
+        remaining = entry.expires_at - time.monotonic()
+        return remaining if remaining > 0 else None
+
+    def set(self, namespace: str, key: Hashable, value: Any, ttl: float):
+        """
+        Store a value for ttl seconds, evicting older entries if over budget.
+        """
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            # Never let one value flush the whole cache
+            return
+
+        if (namespace, key) in self._entries:
+            self._remove(namespace, key)
+
+        self._entries[(namespace, key)] = CacheEntry(value, time.monotonic() + ttl, size)
+        self._namespaces.setdefault(namespace, OrderedDict())[key] = None
+        self.total_bytes += size
+
+        self._writes += 1
+        if self._writes % self.PURGE_INTERVAL == 0:
+            self.purge_expired()
+        self._enforce_limits(namespace)
+
+    def purge_expired(self):
+        """
+        Drop every entry whose TTL has passed.
+        """
+        now = time.monotonic()
+        expired = [item for item, entry in self._entries.items() if entry.expires_at <= now]
+        for namespace, key in expired:
+            self._remove(namespace, key)
+            self._namespace_stats(namespace)["expirations"] += 1
+
+    def clear(self):
+        """
+        Remove all entries. Counters are kept.
+        """
+        self._entries.clear()
+        self._namespaces.clear()
+        self.total_bytes = 0
+
+    def record(self, namespace: str, counter: str):
+        """
+        Increment one of a namespace's counters.
+        """
+        self._namespace_stats(namespace)[counter] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Return hit/miss/eviction counters per namespace plus current usage.
+        """
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "namespaces": {
+                namespace: dict(stats, entries=len(self._namespaces.get(namespace, ())))
+                for namespace, stats in self._stats.items()
+            },
+        }
+
+    def _enforce_limits(self, namespace: str):
+        limit = self._namespace_limits.get(namespace)
+        keys = self._namespaces[namespace]
+        while limit is not None and len(keys) > limit:
+            self._evict(namespace, next(iter(keys)))
+
+        while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            oldest_namespace, oldest_key = next(iter(self._entries))
+            self._evict(oldest_namespace, oldest_key)
+
+    def _evict(self, namespace: str, key: Hashable):
+        self._remove(namespace, key)
+        self._namespace_stats(namespace)["evictions"] += 1
+
+    def _remove(self, namespace: str, key: Hashable):
+        entry = self._entries.pop((namespace, key))
+        self.total_bytes -= entry.size
+        keys = self._namespaces[namespace]
+        del keys[key]
+        if not keys:
+            del self._namespaces[namespace]
+
+    def _namespace_stats(self, namespace: str) -> Dict[str, int]:
+        stats = self._stats.get(namespace)
+        if stats is None:
+            stats = self._stats[namespace] = {
+                "hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "coalesced": 0,
+                "shared_hits": 0, "shared_errors": 0
+            }
+        return stats
+
+def estimate_size(value: Any, _depth: int = 0) -> int:
+    """
+    Roughly estimate the memory held by a cached value, in bytes.
+    """
+    size = sys.getsizeof(value)
+    if _depth > 4 or isinstance(value, (str, bytes, int, float, bool)) or value is None:
+        return size
+    if isinstance(value, dict):
+        return size + sum(
+            estimate_size(k, _depth + 1) + estimate_size(v, _depth + 1) for k, v in value.items()
+        )
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return size + sum(estimate_size(item, _depth + 1) for item in value)
+    if hasattr(value, "__dict__"):
+        return size + estimate_size(vars(value), _depth + 1)
+    if hasattr(value, "__slots__"):
+        return size + sum(estimate_size(getattr(value, name, None), _depth + 1) for name in value.__slots__)
+    return size
+
+class Codec:
+    """
+    Compact serialization for values stored in a shared backend.
+
+    encode turns a value into JSON-compatible data and decode reverses it; the
+    JSON is zlib-compressed on the way to the backend.
+    """
+    def __init__(self, encode: Callable[[Any], Any], decode: Callable[[Any], Any]):
+        self.encode = encode
+        self.decode = decode
+
+    def dumps(self, value: Any) -> bytes:
+        data = json.dumps(self.encode(value), separators=(",", ":"), ensure_ascii=False)
+        return zlib.compress(data.encode("utf-8"))
+
+    def loads(self, data: bytes) -> Any:
+        return self.decode(json.loads(zlib.decompress(data).decode("utf-8")))
+
+# Codec for plain strings and other JSON-native values
+TEXT_CODEC = Codec(lambda value: value, lambda value: value)
+
+class CacheBackend:
+    """
+    Interface for out-of-process cache backends shared by all workers.
+    Keys are strings and values are already-serialized bytes.
+    """
+    async def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        raise NotImplementedError
+
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+class SQLiteBackend(CacheBackend):
+    """
+    On-disk backend in a SQLite database, shareable by every worker process on
+    the host. The database is opened and queried in worker threads to keep the
+    event loop free.
+    """
+    # Delete expired rows once every this many writes
+    PURGE_INTERVAL = 500
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn: Optional[sqlite3.Connection] = None
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await asyncio.to_thread(self._set, key, value, ttl)
+
+    async def delete(self, key: str):
+        await asyncio.to_thread(self._execute, "DELETE FROM cache WHERE key = ?", (key,))
+
+    async def close(self):
+        await asyncio.to_thread(self._close)
+
+    def _connect(self) -> sqlite3.Connection:
+        # Called with the lock held, on a worker thread
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    def _close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT value FROM cache WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def _set(self, key: str, value: bytes, ttl: float):
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + ttl)
+            )
+            self._writes += 1
+            if self._writes % self.PURGE_INTERVAL == 0:
+                conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+
+    def _execute(self, sql: str, params: Tuple):
+        with self._lock:
+            self._connect().execute(sql, params)
+
+class RedisBackend(CacheBackend):
+    """
+    Backend speaking the Redis protocol (RESP) over one asyncio connection.
+    Works against Redis or any server implementing GET, SET with PX and DEL.
+    """
+    def __init__(self, url: str):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._command(b"GET", key.encode("utf-8"))
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await self._command(b"SET", key.encode("utf-8"), value, b"PX", str(int(ttl * 1000)).encode())
+
+    async def delete(self, key: str):
+        await self._command(b"DEL", key.encode("utf-8"))
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def _command(self, *parts: bytes) -> Any:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            try:
+                if self._writer is None or self._writer.is_closing():
+                    await self._connect()
+                return await self._send(*parts)
+            except BaseException:
+                # Drop the connection; the next command reconnects. This covers
+                # cancellation too: a command cancelled before its reply was
+                # read would leave that reply to be read by the next command
+                await self.close()
+                raise
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            await self._send(b"AUTH", self.password.encode("utf-8"))
+        if self.db:
+            await self._send(b"SELECT", str(self.db).encode())
+
+    async def _send(self, *parts: bytes) -> Any:
+        command = [b"*%d\r\n" % len(parts)]
+        for part in parts:
+            command.append(b"$%d\r\n%s\r\n" % (len(part), part))
+        self._writer.write(b"".join(command))
+        await self._writer.drain()
+        return await self._read_reply()
+
+    async def _read_reply(self) -> Any:
+        line = await self._reader.readuntil(b"\r\n")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload
+        if kind == b"-":
+            raise RuntimeError(f"Redis error: {payload.decode('utf-8', 'replace')}")
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            return (await self._reader.readexactly(length + 2))[:-2]
+        if kind == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+        raise RuntimeError(f"Unexpected Redis reply: {line!r}")
+
+def create_backend(name: str) -> Optional[CacheBackend]:
+    """
+    Build the shared backend selected by name ("memory", "sqlite" or "redis").
+    "memory" means no shared backend.
+    """
+    if name == "sqlite":
+        path = os.getenv("CACHE_SQLITE_PATH", os.path.join(tempfile.gettempdir(), "luma-cache.sqlite3"))
+        return SQLiteBackend(path)
+    if name == "redis":
+        return RedisBackend(os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0"))
+    if name == "memory":
+        return None
+    raise ValueError(f"Unknown cache backend '{name}'")
+
+_shared_backend: Optional[CacheBackend] = None
+_shared_backend_ready = False
+
+def get_shared_backend() -> Optional[CacheBackend]:
+    """
+    Return the shared backend configured with CACHE_BACKEND, created on first use.
+    """
+    global _shared_backend, _shared_backend_ready
+    if not _shared_backend_ready:
+        _shared_backend = create_backend(os.getenv("CACHE_BACKEND", "memory"))
+        _shared_backend_ready = True
+    return _shared_backend
+
+async def close_shared_backend():
+    """
+    Close the shared backend. Called from the application shutdown hook.
+    """
+    global _shared_backend, _shared_backend_ready
+    if _shared_backend is not None:
+        await _shared_backend.close()
+    _shared_backend = None
+    _shared_backend_ready = False
+
+def normalize_query(query: str) -> str:
     """
-    Simple in-memory cache decorator with TTL (time-to-live) in seconds.
+    Canonical form of a query for cache keys: lowercased, single-spaced.
     """
+    return " ".join(query.lower().split())
+
+def make_key(*parts: Any) -> str:
+    """
+    Hash canonical key parts (strings, numbers, lists of them) into a short,
+    stable digest.
+    """
+    encoded = json.dumps(parts, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.blake2b(encoded.encode("utf-8"), digest_size=16).hexdigest()
+
+def default_key(*args: Any, **kwargs: Any) -> str:
+    """
+    Fallback key function: hashes the repr of all arguments.
+    """
+    return make_key([repr(arg) for arg in args], sorted((k, repr(v)) for k, v in kwargs.items()))
+
+# Shared in-memory cache
+cache_store = CacheStore(
+    max_entries=int(os.getenv("CACHE_MAX_ENTRIES", "2048")),
+    max_bytes=int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+)
+
+def _cache_metrics():
+    """
+    Export the cache counters in the Prometheus text format.
+    """
+    stats = cache_store.get_stats()
+    lines = [
+        "# HELP luma_cache_entries Entries held in the in-memory cache.",
+        "# TYPE luma_cache_entries gauge",
+        f"luma_cache_entries {stats['entries']}",
+        "# HELP luma_cache_bytes Estimated bytes held in the in-memory cache.",
+        "# TYPE luma_cache_bytes gauge",
+        f"luma_cache_bytes {stats['bytes']}",
+    ]
+    for counter in ["hits", "misses", "evictions", "expirations", "coalesced", "shared_hits", "shared_errors"]:
+        lines.append(f"# HELP luma_cache_{counter}_total Cache {counter.replace('_', ' ')} per namespace.")
+        lines.append(f"# TYPE luma_cache_{counter}_total counter")
+        for namespace, namespace_stats in stats["namespaces"].items():
+            lines.append(f'luma_cache_{counter}_total{{namespace="{namespace}"}} {namespace_stats[counter]}')
+    return lines
+
+metrics.add_collector(_cache_metrics)
+
+# Upstream calls currently running, so identical misses can share them, and
+# the number of callers waiting on each
+_inflight: Dict[Tuple[str, Hashable], asyncio.Future] = {}
+_inflight_waiters: Dict[Tuple[str, Hashable], int] = {}
+
+def cache(
+    ttl: int = 3600,
+    namespace: Optional[str] = None,
+    max_entries: Optional[int] = None,
+    key: Optional[Callable[..., Hashable]] = None,
+    codec: Optional[Codec] = None,
+    condition: Optional[Callable[[Any], bool]] = None
+):
+    """
+    Cache decorator with TTL (time-to-live) in seconds.
+
+    Concurrent calls that miss on the same key are coalesced into a single call
+    of the wrapped function, which is cancelled once every caller waiting on it
+    has been cancelled. Entries live in the shared LRU cache_store under
+    the given namespace (the function's qualified name by default).
+
+    key is called with the function's arguments, minus self for methods, and
+    must return a hashable cache key. It defaults to default_key.
+
+    With a codec, results are also written to the shared backend selected by
+    CACHE_BACKEND, and in-memory misses are looked up there before calling the
+    wrapped function.
+
+    With a condition, only results for which condition(result) is true are
+    stored, e.g. to keep error responses out of the cache.
+
+    The wrapper's refresh attribute calls the function and replaces the cached
+    value even if it has not expired yet, and expires_in returns the seconds
+    left on the cached value (None when there is none). Both take the same
+    arguments as the function; see refresh_cached and cached_expires_in for
+    bound methods.
+    """
+    key_func = key or default_key
+
     def decorator(func):
+        cache_namespace = namespace or func.__qualname__
+        if max_entries is not None:
+            cache_store.set_namespace_limit(cache_namespace, max_entries)
+
+        # The instance never takes part in the key of a cached method
+        parameters = list(inspect.signature(func).parameters)
+        skip_self = bool(parameters) and parameters[0] == "self"
+
         @functools.wraps(func)
         async def wrapper(*args, **kwargs):
-            # Create a cache key from the function name and arguments
-            key = (func.__name__, str(args), str(kwargs))
-            
+            # Create a cache key from the function arguments
+            key = key_func(*(args[1:] if skip_self else args), **kwargs)
+
             # Check if we have a cached result that hasn't expired
-            if key in cache_store:
-                result, timestamp = cache_store[key]
-                if time.time() - timestamp < ttl:
+            found, result = cache_store.get(cache_namespace, key)
+            if found:
+                return result
+
+            return await call(key, args, kwargs, lookup_shared=True)
+
+        async def refresh(*args, **kwargs):
+            key = key_func(*(args[1:] if skip_self else args), **kwargs)
+            return await call(key, args, kwargs, lookup_shared=False)
+
+        def expires_in(*args, **kwargs) -> Optional[float]:
+            key = key_func(*(args[1:] if skip_self else args), **kwargs)
+            return cache_store.expires_in(cache_namespace, key)
+
+        async def call(key: Hashable, args: tuple, kwargs: dict, lookup_shared: bool):
+            # Join an identical call that is already running
+            flight_key = (cache_namespace, key)
+            task = _inflight.get(flight_key)
+            if task is not None and task.get_loop() is asyncio.get_running_loop():
+                cache_store.record(cache_namespace, "coalesced")
+                return await _wait_flight(flight_key, task)
+
+            # Call the function in its own task so that one cancelled caller
+            # does not cancel the call for everyone else waiting on it
+            async def fill():
+                backend = get_shared_backend() if codec is not None else None
+                backend_key = f"{cache_namespace}:{key}"
+
+                if backend is not None and lookup_shared:
+                    try:
+                        data = await backend.get(backend_key)
+                        if data is not None:
+                            result = codec.loads(data)
+                            cache_store.set(cache_namespace, key, result, ttl)
+                            cache_store.record(cache_namespace, "shared_hits")
+                            return result
+                    except Exception as e:
+                        cache_store.record(cache_namespace, "shared_errors")
+                        print(f"Cache backend error: {str(e)}")
+
+                result = await func(*args, **kwargs)
+                if condition is not None and not condition(result):
                     return result
-            
-            # Call the function and cache the result
-            result = await func(*args, **kwargs)
-            cache_store[key] = (result, time.time())
-            return result
-        
+                cache_store.set(cache_namespace, key, result, ttl)
+
+                if backend is not None:
+                    try:
+                        await backend.set(backend_key, codec.dumps(result), ttl)
+                    except Exception as e:
+                        cache_store.record(cache_namespace, "shared_errors")
+                        print(f"Cache backend error: {str(e)}")
+                return result
+
+            task = asyncio.ensure_future(fill())
+            _inflight[flight_key] = task
+            _inflight_waiters[flight_key] = 0
+            task.add_done_callback(functools.partial(_finish_flight, flight_key))
+            return await _wait_flight(flight_key, task)
+
+        wrapper.refresh = refresh
+        wrapper.expires_in = expires_in
         return wrapper
-    
-    return decorator 
\ No newline at end of file
+
+    return decorator
+
+def refresh_cached(cached: Callable, *args: Any, **kwargs: Any) -> Awaitable[Any]:
+    """
+    Recompute and re-cache a @cache-decorated function or bound method's
+    value for the given arguments.
+    """
+    func, args = _unbind(cached, args)
+    return func.refresh(*args, **kwargs)
+
+def cached_expires_in(cached: Callable, *args: Any, **kwargs: Any) -> Optional[float]:
+    """
+    Seconds left on a @cache-decorated function or bound method's cached
+    value for the given arguments, or None if it is not cached.
+    """
+    func, args = _unbind(cached, args)
+    return func.expires_in(*args, **kwargs)
+
+def _unbind(cached: Callable, args: tuple) -> Tuple[Callable, tuple]:
+    # A bound method's wrapper attributes live on the underlying function
+    if inspect.ismethod(cached):
+        return cached.__func__, (cached.__self__,) + args
+    return cached, args
+
+async def _wait_flight(flight_key: Tuple[str, Hashable], task: asyncio.Future) -> Any:
+    # Shielded so that one caller giving up does not cancel the call for the
+    # others; the call is cancelled once every caller has given up, so that
+    # callers' timeouts still stop the work (and free what it holds)
+    _inflight_waiters[flight_key] += 1
+    try:
+        return await asyncio.shield(task)
+    finally:
+        if _inflight.get(flight_key) is task:
+            _inflight_waiters[flight_key] -= 1
+            if _inflight_waiters[flight_key] == 0 and not task.done():
+                task.cancel()
+
+def _finish_flight(flight_key: Tuple[str, Hashable], task: asyncio.Future):
+    if _inflight.get(flight_key) is task:
+        del _inflight[flight_key]
+        del _inflight_waiters[flight_key]
+    # Mark the exception as retrieved even if every caller went away
+    if not task.cancelled():
+        task.exception()
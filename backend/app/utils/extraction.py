@@ -0,0 +1,226 @@
+import os
+import asyncio
+import multiprocessing
+import signal
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+from app.utils.html_parser import get_html_parser
+from app.utils.metrics import PAGE_EXTRACT_SECONDS, EXTRACTION_POOL_EVENTS
+
+class Extractor:
+    """
+    Main-text extraction: trafilatura first, the HTML parser's heuristic
+    extractor for pages trafilatura cannot handle.
+    """
+    def __init__(self):
+        # Imported here rather than at startup: trafilatura takes a while to
+        # import, and only the processes or threads that extract need it
+        import trafilatura
+        from trafilatura.settings import use_config
+
+        self.trafilatura = trafilatura
+        self.html_parser = get_html_parser()
+        # trafilatura's own extraction timeout relies on signals, which only
+        # work on the main thread; timeouts are enforced by ExtractionPool
+        self.trafilatura_config = use_config()
+        self.trafilatura_config.set("DEFAULT", "EXTRACTION_TIMEOUT", "0")
+
+    def extract(self, data: bytes, encoding: Optional[str]) -> Tuple[str, str]:
+        """
+        Return the main text of a page and the name of the extractor that found it.
+        """
+        html = decode_html(data, encoding)
+        extracted = self.trafilatura.extract(
+            html, include_comments=False, include_tables=True, config=self.trafilatura_config
+        )
+        if extracted:
+            return extracted, "trafilatura"
+        return self.html_parser.extract_main_text(html), "fallback"
+
+def decode_html(data: bytes, encoding: Optional[str]) -> str:
+    try:
+        return data.decode(encoding or "utf-8", errors="replace")
+    except LookupError:
+        return data.decode("utf-8", errors="replace")
+
+# Per-process extractor of pool workers, set up by _init_worker
+_worker_extractor: Optional[Extractor] = None
+
+class _CPUTimeExceeded(BaseException):
+    # Not an Exception, so that trafilatura's own error handling cannot swallow it
+    pass
+
+def _on_cpu_limit(signum, frame):
+    raise _CPUTimeExceeded()
+
+def _init_worker():
+    global _worker_extractor
+    _worker_extractor = Extractor()
+    # A terminal's Ctrl+C goes to the server, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if hasattr(signal, "SIGVTALRM"):
+        signal.signal(signal.SIGVTALRM, _on_cpu_limit)
+
+def _extract_in_worker(data: bytes, encoding: Optional[str], cpu_limit: float) -> Tuple[str, str, float]:
+    """
+    Extract one page in a pool worker, giving up after cpu_limit seconds of
+    CPU time. Returns (text, extractor, seconds).
+    """
+    start = time.perf_counter()
+    # The virtual timer only counts this process's own CPU time
+    timer = cpu_limit > 0 and hasattr(signal, "setitimer")
+    if timer:
+        signal.setitimer(signal.ITIMER_VIRTUAL, cpu_limit)
+    try:
+        text, extractor = _worker_extractor.extract(data, encoding)
+    except _CPUTimeExceeded:
+        text, extractor = "", "timeout"
+    finally:
+        if timer:
+            signal.setitimer(signal.ITIMER_VIRTUAL, 0)
+    return text, extractor, time.perf_counter() - start
+
+def _warm_up() -> int:
+    return os.getpid()
+
+class ExtractionPool:
+    """
+    Runs page extraction off the event loop, in worker processes ("process")
+    or in threads of this process ("thread"). "auto" picks processes on
+    machines with more than one core.
+
+    Extraction is CPU-bound pure Python that holds the GIL, so a process pool
+    lets one API process use every core. Workers are replaced after
+    max_tasks_per_child pages on average (trafilatura leaks memory), each page
+    gets cpu_limit seconds of CPU time, and if the pool cannot be used the
+    page is extracted in a thread of this process instead.
+    """
+    def __init__(
+        self,
+        mode: str = "auto",
+        workers: int = 4,
+        max_tasks_per_child: int = 200,
+        cpu_limit: float = 5
+    ):
+        if mode == "auto":
+            # Worker processes only pay off with a core to spare for them
+            mode = "process" if (os.cpu_count() or 1) > 1 else "thread"
+        if mode not in ("process", "thread"):
+            raise ValueError(f"Unknown extraction mode '{mode}'")
+        self.mode = mode
+        self.workers = workers
+        self.max_tasks_per_child = max_tasks_per_child
+        self.cpu_limit = cpu_limit
+
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_tasks = 0
+        # In-process extraction, used in thread mode and as the fallback
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._extractor: Optional[Extractor] = None
+        self._extractor_lock = threading.Lock()
+
+    async def start(self):
+        """
+        Start the workers ahead of the first page. Called from the application
+        startup hook.
+        """
+        if self.mode != "process":
+            # Set up the in-process extractor on one of its threads
+            await asyncio.get_running_loop().run_in_executor(self._get_threads(), self._get_extractor)
+            return
+        try:
+            pool = self._get_pool()
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*(loop.run_in_executor(pool, _warm_up) for _ in range(self.workers)))
+        except Exception as e:
+            print(f"Extraction pool failed to start, extracting in-process: {str(e)}")
+            self._retire_pool(self._pool, "broken")
+
+    async def extract(self, data: bytes, encoding: Optional[str] = None) -> str:
+        """
+        Extract the main text of a page from its raw HTML bytes.
+        """
+        loop = asyncio.get_running_loop()
+        if self.mode == "process":
+            pool = None
+            try:
+                pool = self._get_pool()
+                future = loop.run_in_executor(pool, _extract_in_worker, data, encoding, self.cpu_limit)
+                # Backstop for a worker that never returns control to Python
+                text, extractor, seconds = await asyncio.wait_for(future, timeout=self.cpu_limit * 2 + 1)
+                PAGE_EXTRACT_SECONDS.observe(seconds, extractor=extractor)
+                return text
+            except asyncio.TimeoutError:
+                PAGE_EXTRACT_SECONDS.observe(self.cpu_limit * 2 + 1, extractor="timeout")
+                self._retire_pool(pool, "timeout")
+                return ""
+            except (BrokenProcessPool, OSError, RuntimeError) as e:
+                print(f"Extraction pool error, extracting in-process: {str(e)}")
+                self._retire_pool(pool, "broken")
+
+        return await loop.run_in_executor(self._get_threads(), self._extract_in_thread, data, encoding)
+
+    def close(self):
+        """
+        Shut the workers down. Called from the application shutdown hook.
+        """
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        if self._threads is not None:
+            self._threads.shutdown(wait=False)
+            self._threads = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # Recycle the whole pool once its workers have handled
+        # max_tasks_per_child pages each; tasks in flight still finish
+        if self._pool is not None and self._pool_tasks >= self.max_tasks_per_child * self.workers:
+            self._retire_pool(self._pool, "recycled")
+        if self._pool is None:
+            # Forking a process that runs an event loop and threads is unsafe
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=_init_worker)
+            self._pool_tasks = 0
+        self._pool_tasks += 1
+        return self._pool
+
+    def _retire_pool(self, pool: Optional[ProcessPoolExecutor], reason: str):
+        # Only the current pool: another page may have replaced a failed one already
+        if pool is None or pool is not self._pool:
+            return
+        EXTRACTION_POOL_EVENTS.inc(event=reason)
+        self._pool = None
+        if reason == "recycled":
+            # Healthy workers finish the pages in flight and exit
+            pool.shutdown(wait=False)
+            return
+        # shutdown() cannot stop a wedged worker, so kill every worker of a
+        # failed pool; pages still running on it fall back to in-process
+        # extraction
+        processes = list((getattr(pool, "_processes", None) or {}).values())
+        pool.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    def _get_threads(self) -> Executor:
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="content-extract")
+        return self._threads
+
+    def _get_extractor(self) -> Extractor:
+        # Created on first use, on an extraction thread, to keep the import off the event loop
+        with self._extractor_lock:
+            if self._extractor is None:
+                self._extractor = Extractor()
+            return self._extractor
+
+    def _extract_in_thread(self, data: bytes, encoding: Optional[str]) -> str:
+        extractor = self._get_extractor()
+        with PAGE_EXTRACT_SECONDS.time(extractor="trafilatura") as labels:
+            text, labels["extractor"] = extractor.extract(data, encoding)
+            return text
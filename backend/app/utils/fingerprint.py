@@ -0,0 +1,40 @@
+import hashlib
+import re
+from typing import List, Optional
+from app.utils.lazy import optional_module
+
+WORD_PATTERN = re.compile(r"\w+")
+
+def simhash(text: str, shingle: int = 3, min_words: int = 50) -> Optional[int]:
+    """
+    64-bit SimHash of a text's word shingles. Texts that share most of their
+    wording get fingerprints that differ in few bits.
+
+    Returns None for texts shorter than min_words words, which are too short
+    to fingerprint reliably.
+    """
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < max(min_words, shingle):
+        return None
+    hashes = [
+        int.from_bytes(hashlib.blake2b(" ".join(words[i:i + shingle]).encode("utf-8"), digest_size=8).digest(), "little")
+        for i in range(len(words) - shingle + 1)
+    ]
+
+    np = optional_module("numpy")
+    if np is not None:
+        # One row of 64 bits per shingle; a bit is set in the fingerprint when
+        # more than half of the shingles have it
+        bits = np.unpackbits(np.array(hashes, dtype="<u8").view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+        votes = bits.sum(axis=0, dtype=np.int64) * 2 > len(hashes)
+        return sum(1 << bit for bit in np.flatnonzero(votes).tolist())
+
+    counts: List[int] = [0] * 64
+    for value in hashes:
+        for bit in range(64):
+            if value >> bit & 1:
+                counts[bit] += 1
+    return sum(1 << bit for bit, count in enumerate(counts) if count * 2 > len(hashes))
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
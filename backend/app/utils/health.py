@@ -0,0 +1,198 @@
+import os
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+from app.utils.metrics import metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class Permit:
+    """
+    Permission for one call, returned by BackendHealth.allow. probe is true
+    for the single call let through while half-open.
+    """
+    __slots__ = ("probe",)
+
+    def __init__(self, probe: bool = False):
+        self.probe = probe
+
+# Shared by every call that is not a probe
+ORDINARY_CALL = Permit()
+
+class BackendHealth:
+    """
+    Rolling success/latency stats and a circuit breaker for one backend.
+
+    After failure_threshold consecutive failures the circuit opens and the
+    backend is skipped for cooldown seconds. Then it is half-open: a single
+    probe call is let through, which closes the circuit on success and opens
+    it again on failure.
+    """
+    # Prior assumed for backends with few samples, weighted as this many calls
+    PRIOR_WEIGHT = 2
+    PRIOR_LATENCY = 1.0
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        cooldown: float = 30,
+        window: int = 50,
+        max_age: float = 300
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        # Calls older than max_age seconds no longer count, so a backend that
+        # was passed over after a bad spell drifts back to the prior
+        self.max_age = max_age
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self._probe: Optional[Permit] = None
+        # (succeeded, seconds, finished at) of the most recent calls
+        self.calls: deque = deque(maxlen=window)
+
+    def allow(self) -> Optional[Permit]:
+        """
+        Whether a call may be made now: a Permit, or None. Claims the probe
+        when half-open.
+        """
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = HALF_OPEN
+        if self.state == CLOSED:
+            return ORDINARY_CALL
+        if self.state == HALF_OPEN and not self.probing:
+            self.probing = True
+            self._probe = Permit(probe=True)
+            return self._probe
+        return None
+
+    def record_success(self, seconds: float):
+        self.calls.append((True, seconds, time.monotonic()))
+        self.consecutive_failures = 0
+        self._release_probe()
+        self.state = CLOSED
+
+    def record_failure(self, seconds: float):
+        self.calls.append((False, seconds, time.monotonic()))
+        self.consecutive_failures += 1
+        self._release_probe()
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def record_cancelled(self, permit: Permit):
+        """
+        A call was abandoned before it finished: release the probe, if it was one.
+        """
+        if permit is self._probe:
+            self._release_probe()
+
+    def success_rate(self) -> float:
+        self._prune()
+        successes = sum(1 for succeeded, _, _ in self.calls if succeeded)
+        return (successes + self.PRIOR_WEIGHT) / (len(self.calls) + self.PRIOR_WEIGHT)
+
+    def mean_latency(self) -> float:
+        self._prune()
+        total = sum(seconds for _, seconds, _ in self.calls)
+        return (total + self.PRIOR_LATENCY * self.PRIOR_WEIGHT) / (len(self.calls) + self.PRIOR_WEIGHT)
+
+    def expected_cost(self) -> float:
+        """
+        Expected seconds spent per useful answer: mean latency divided by the
+        success rate.
+        """
+        return self.mean_latency() / max(self.success_rate(), 0.05)
+
+    def snapshot(self) -> Dict[str, Any]:
+        self._prune()
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "calls": len(self.calls),
+            "success_rate": round(self.success_rate(), 3),
+            "mean_latency": round(self.mean_latency(), 3),
+        }
+
+    def _release_probe(self):
+        self.probing = False
+        self._probe = None
+
+    def _prune(self):
+        cutoff = time.monotonic() - self.max_age
+        while self.calls and self.calls[0][2] < cutoff:
+            self.calls.popleft()
+
+class HealthTracker:
+    """
+    Health of a group of interchangeable backends, e.g. the search engines.
+    """
+    def __init__(self, kind: str, names: List[str], adaptive: bool = True):
+        self.kind = kind
+        self.names = list(names)
+        self.adaptive = adaptive
+        failure_threshold = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+        cooldown = float(os.getenv("CIRCUIT_COOLDOWN", "30"))
+        window = int(os.getenv("HEALTH_WINDOW", "50"))
+        max_age = float(os.getenv("HEALTH_MAX_AGE", "300"))
+        self.backends = {
+            name: BackendHealth(name, failure_threshold, cooldown, window, max_age) for name in names
+        }
+        _trackers.append(self)
+
+    def get(self, name: str) -> BackendHealth:
+        return self.backends[name]
+
+    def order(self) -> List[Tuple[str, Permit]]:
+        """
+        Backends worth calling, best first, each with its Permit. Open circuits
+        are left out unless every circuit is open, in which case all are tried
+        in preference order.
+
+        Half-open backends in the list have their probe claimed; callers must
+        record an outcome for every backend they are given, or record_cancelled
+        for those they end up not calling.
+        """
+        available = []
+        for name in self.names:
+            permit = self.backends[name].allow()
+            if permit is not None:
+                available.append((name, permit))
+        if not available:
+            return [(name, ORDINARY_CALL) for name in self.names]
+        if self.adaptive:
+            # Stable sort, so preference order breaks ties
+            available.sort(key=lambda entry: self.backends[entry[0]].expected_cost())
+        return available
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {name: backend.snapshot() for name, backend in self.backends.items()}
+
+_trackers: List[HealthTracker] = []
+
+def get_health_snapshot() -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """
+    Health of every tracked backend, grouped by kind.
+    """
+    return {tracker.kind: tracker.snapshot() for tracker in _trackers}
+
+def _health_metrics() -> List[str]:
+    """
+    Export circuit states (0 closed, 1 half-open, 2 open) in the Prometheus text format.
+    """
+    values = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+    lines = [
+        "# HELP luma_backend_circuit_state Circuit breaker state per backend (0 closed, 1 half-open, 2 open).",
+        "# TYPE luma_backend_circuit_state gauge",
+    ]
+    for tracker in _trackers:
+        for name, backend in tracker.backends.items():
+            lines.append(f'luma_backend_circuit_state{{kind="{tracker.kind}",backend="{name}"}} {values[backend.state]}')
+    return lines
+
+metrics.add_collector(_health_metrics)
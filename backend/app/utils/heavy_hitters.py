@@ -0,0 +1,89 @@
+import hashlib
+import heapq
+import time
+from typing import Dict, List, Tuple
+
+class CountMinSketch:
+    """
+    Approximate counts of a stream of strings in fixed memory.
+
+    Counts are never underestimated; they are overestimated by at most about
+    2/width of the total count with high probability.
+    """
+    def __init__(self, width: int = 2048, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self.rows: List[List[int]] = [[0] * width for _ in range(depth)]
+
+    def add(self, item: str, count: int = 1) -> int:
+        """
+        Count an item and return its new estimated count.
+        """
+        estimate = None
+        for row, column in zip(self.rows, self._columns(item)):
+            row[column] += count
+            estimate = row[column] if estimate is None else min(estimate, row[column])
+        return estimate
+
+    def estimate(self, item: str) -> int:
+        return min(row[column] for row, column in zip(self.rows, self._columns(item)))
+
+    def halve(self):
+        """
+        Halve every count, so that older traffic weighs less.
+        """
+        for row in self.rows:
+            row[:] = [value >> 1 for value in row]
+
+    def _columns(self, item: str) -> List[int]:
+        # One 64-bit hash per row from a single digest
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=8 * self.depth).digest()
+        return [int.from_bytes(digest[i * 8:(i + 1) * 8], "little") % self.width for i in range(self.depth)]
+
+class HeavyHitters:
+    """
+    The k most frequent items of a stream, with counts that decay by half
+    every half_life seconds so that the top reflects recent traffic.
+
+    Frequencies come from a count-min sketch; only the k current leaders are
+    kept by name.
+    """
+    def __init__(self, k: int = 50, width: int = 2048, depth: int = 4, half_life: float = 3600):
+        self.k = k
+        self.half_life = half_life
+        self.sketch = CountMinSketch(width, depth)
+        self._top: Dict[str, int] = {}
+        self._decayed_at = time.monotonic()
+
+    def add(self, item: str) -> int:
+        """
+        Count one occurrence of an item and return its estimated count.
+        """
+        self._decay()
+        count = self.sketch.add(item)
+        if item in self._top or len(self._top) < self.k:
+            self._top[item] = count
+            return count
+
+        weakest = min(self._top, key=self._top.get)
+        if count > self._top[weakest]:
+            del self._top[weakest]
+            self._top[item] = count
+        return count
+
+    def top(self, n: int) -> List[Tuple[str, int]]:
+        """
+        Up to n (item, count) pairs, most frequent first.
+        """
+        self._decay()
+        return heapq.nlargest(n, self._top.items(), key=lambda pair: pair[1])
+
+    def _decay(self):
+        periods = int((time.monotonic() - self._decayed_at) // self.half_life)
+        if periods <= 0:
+            return
+        self._decayed_at += periods * self.half_life
+        # Past 32 halvings every count is zero anyway
+        for _ in range(min(periods, 32)):
+            self.sketch.halve()
+            self._top = {item: count >> 1 for item, count in self._top.items() if count > 1}
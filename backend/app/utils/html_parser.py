@@ -0,0 +1,175 @@
+import os
+import re
+from typing import List, Optional
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+# Elements that never hold the main content of a page
+NON_CONTENT_TAGS = ['script', 'style', 'header', 'footer', 'nav', 'aside', 'iframe', 'noscript']
+
+# Common ad and navigation class names
+NON_CONTENT_CLASSES = re.compile('(ad|banner|menu|sidebar|footer|header|nav|comment)')
+
+# Candidate containers for the main content, in order of preference
+MAIN_CONTENT_SELECTORS = ['main', 'article', 'div[role="main"]', '.main-content', '#content', '#main']
+
+class SoupNode:
+    """
+    Element wrapper for the BeautifulSoup parser.
+    """
+    __slots__ = ("node",)
+
+    def __init__(self, node):
+        self.node = node
+
+    def select(self, css: str) -> List["SoupNode"]:
+        return [SoupNode(node) for node in self.node.select(css)]
+
+    def select_one(self, css: str) -> Optional["SoupNode"]:
+        node = self.node.select_one(css)
+        return SoupNode(node) if node is not None else None
+
+    def get_text(self, separator: str = "", strip: bool = False) -> str:
+        return self.node.get_text(separator=separator, strip=strip)
+
+    def get(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        return self.node.get(name, default)
+
+class LexborNode:
+    """
+    Element wrapper for the selectolax (lexbor) parser, matching SoupNode.
+    """
+    __slots__ = ("node",)
+
+    def __init__(self, node):
+        self.node = node
+
+    def select(self, css: str) -> List["LexborNode"]:
+        return [LexborNode(node) for node in self.node.css(css)]
+
+    def select_one(self, css: str) -> Optional["LexborNode"]:
+        node = self.node.css_first(css)
+        return LexborNode(node) if node is not None else None
+
+    def get_text(self, separator: str = "", strip: bool = False) -> str:
+        if not strip:
+            return self.node.text(deep=True, separator=separator)
+        # Strip each text node and skip empty ones, like BeautifulSoup does
+        pieces = self.node.text(deep=True, separator="\x00").split("\x00")
+        return separator.join(piece for piece in (piece.strip() for piece in pieces) if piece)
+
+    def get(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        value = self.node.attributes.get(name)
+        return default if value is None else value
+
+class BeautifulSoupParser:
+    """
+    Pure-Python parser based on BeautifulSoup's html.parser.
+    """
+    name = "bs4"
+
+    def __init__(self):
+        # Imported here: BeautifulSoup is only the fallback parser and is slow to import
+        from bs4 import BeautifulSoup
+        self.BeautifulSoup = BeautifulSoup
+
+    def parse(self, html: str) -> SoupNode:
+        return SoupNode(self.BeautifulSoup(html, 'html.parser'))
+
+    def extract_main_text(self, html: str) -> str:
+        """
+        Extract the main content from an HTML page, removing navigation, ads, etc.
+        """
+        soup = self.BeautifulSoup(html, 'html.parser')
+
+        # Remove script, style, and other non-content elements
+        for element in soup(NON_CONTENT_TAGS):
+            element.decompose()
+
+        # Remove common ad and navigation class names
+        for element in soup.find_all(class_=NON_CONTENT_CLASSES):
+            element.decompose()
+
+        # Try to find the main content
+        main_content = None
+        for selector in MAIN_CONTENT_SELECTORS:
+            main_content = soup.select_one(selector)
+            if main_content:
+                break
+
+        if main_content:
+            text = main_content.get_text(separator=' ', strip=True)
+        else:
+            # If no main content found, use the whole document
+            text = soup.get_text(separator=' ', strip=True)
+
+        # Clean up whitespace
+        return re.sub(r'\s+', ' ', text).strip()
+
+class SelectolaxParser:
+    """
+    C-backed parser based on selectolax's lexbor engine.
+    """
+    name = "selectolax"
+
+    def parse(self, html: str) -> LexborNode:
+        return LexborNode(LexborHTMLParser(html).root)
+
+    def extract_main_text(self, html: str) -> str:
+        """
+        Extract the main content from an HTML page, removing navigation, ads, etc.
+        Mirrors BeautifulSoupParser.extract_main_text.
+        """
+        tree = LexborHTMLParser(html)
+        if tree.root is None:
+            return ""
+
+        # Remove script, style, and other non-content elements
+        tree.strip_tags(NON_CONTENT_TAGS)
+
+        # Remove common ad and navigation class names. Only the outermost match
+        # is removed, since removing it already removes everything inside it.
+        matches = [
+            node for node in tree.css('[class]')
+            if NON_CONTENT_CLASSES.search(node.attributes.get('class') or '')
+        ]
+        matched_ids = {node.mem_id for node in matches}
+        for node in matches:
+            parent = node.parent
+            while parent is not None and parent.mem_id not in matched_ids:
+                parent = parent.parent
+            if parent is None:
+                node.decompose()
+
+        # Try to find the main content
+        main_content = None
+        for selector in MAIN_CONTENT_SELECTORS:
+            main_content = tree.css_first(selector)
+            if main_content is not None:
+                break
+
+        if main_content is None:
+            # If no main content found, use the whole document
+            main_content = tree.root
+        text = LexborNode(main_content).get_text(separator=' ', strip=True)
+
+        # Clean up whitespace
+        return re.sub(r'\s+', ' ', text).strip()
+
+def get_html_parser(name: Optional[str] = None):
+    """
+    Return the HTML parser selected by name or HTML_PARSER ("selectolax" or
+    "bs4"), falling back to BeautifulSoup when selectolax is not installed.
+    """
+    name = name or os.getenv("HTML_PARSER", "selectolax")
+    if name == "selectolax":
+        if LexborHTMLParser is not None:
+            return SelectolaxParser()
+        print("WARNING: selectolax is not installed, falling back to BeautifulSoup")
+        return BeautifulSoupParser()
+    if name == "bs4":
+        return BeautifulSoupParser()
+    raise ValueError(f"Unknown HTML parser '{name}'")
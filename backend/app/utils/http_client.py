@@ -0,0 +1,77 @@
+import os
+import asyncio
+import aiohttp
+from typing import Dict, Optional
+
+class HTTPClient:
+    """
+    Application-scoped aiohttp session shared by every service.
+
+    One pooled connector keeps connections alive between calls and caches DNS
+    lookups, so outbound requests skip the TCP/TLS handshake whenever possible.
+    """
+    def __init__(self):
+        # Connector limits
+        self.limit = int(os.getenv("HTTP_POOL_LIMIT", "100"))
+        self.limit_per_host = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "10"))
+        self.dns_cache_ttl = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))
+        self.keepalive_timeout = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "30"))
+
+        # Timeout profiles per destination (seconds)
+        self.timeouts: Dict[str, aiohttp.ClientTimeout] = {
+            "search": aiohttp.ClientTimeout(
+                total=float(os.getenv("HTTP_SEARCH_TIMEOUT", "8")),
+                sock_connect=3
+            ),
+            "content": aiohttp.ClientTimeout(
+                total=float(os.getenv("HTTP_CONTENT_TIMEOUT", "10")),
+                sock_connect=3
+            ),
+            "llm": aiohttp.ClientTimeout(
+                total=float(os.getenv("HTTP_LLM_TIMEOUT", "60")),
+                sock_connect=5
+            ),
+        }
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def start(self):
+        """
+        Create the shared session. Called from the application startup hook.
+        """
+        self.get_session()
+
+    async def close(self):
+        """
+        Close the shared session and its pooled connections.
+        """
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._loop = None
+
+    def get_session(self) -> aiohttp.ClientSession:
+        """
+        Return the shared session, creating it on first use.
+        """
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_cache_ttl,
+                use_dns_cache=True,
+                keepalive_timeout=self.keepalive_timeout
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._loop = loop
+        return self._session
+
+    def timeout(self, profile: str) -> aiohttp.ClientTimeout:
+        """
+        Return the timeout profile for a destination ("search", "content" or "llm").
+        """
+        return self.timeouts[profile]
+
+http_client = HTTPClient()
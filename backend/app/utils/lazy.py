@@ -0,0 +1,28 @@
+import asyncio
+import functools
+import importlib
+from types import ModuleType
+from typing import Iterable, Optional
+
+# Heavy modules that only some requests need. They are imported on first use
+# instead of at startup, and preloaded in the background once the server is up.
+# trafilatura is loaded by the extraction pool, in its workers when it has them.
+HEAVY_MODULES = ("numpy",)
+
+@functools.lru_cache(maxsize=None)
+def optional_module(name: str) -> Optional[ModuleType]:
+    """
+    Import a module on first use. Returns None if it is not installed.
+    """
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+async def preload(names: Iterable[str] = HEAVY_MODULES):
+    """
+    Import modules in a worker thread so that the first request that needs
+    them does not pay for the import on the event loop.
+    """
+    for name in names:
+        await asyncio.to_thread(optional_module, name)
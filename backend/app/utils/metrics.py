@@ -0,0 +1,221 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from a cache hit up to a slow LLM call
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Per-request (name, seconds) timings reported in the Server-Timing header
+server_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("server_timings", default=None)
+
+class Metric:
+    """
+    Base class for a metric family with a fixed set of label names.
+    """
+    kind = ""
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def _format_labels(self, key: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        return lines + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        super().__init__(name, description, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{self._format_labels(key)} {value:g}" for key, value in values]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels: str):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket..., +Inf count], sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, timing: Optional[str] = None, **labels: str) -> Iterator[Dict[str, str]]:
+        """
+        Time the block. Yields the labels so the block can fill in an outcome.
+        With timing set, the duration is also reported in Server-Timing.
+        """
+        start = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe(elapsed, **labels)
+            if timing:
+                record_timing(timing, elapsed)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = [(key, list(counts), total[0]) for key, (counts, total) in self._values.items()]
+
+        lines = []
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                bucket = 'le="%g"' % bound
+                lines.append(f"{self.name}_bucket{self._format_labels(key, bucket)} {cumulative}")
+            cumulative += counts[-1]
+            bucket = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{self._format_labels(key, bucket)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {total:g}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    """
+    Holds every metric and renders them in the Prometheus text format.
+    Collectors are callbacks that return extra exposition lines on demand.
+    """
+    def __init__(self):
+        self._metrics: List[Metric] = []
+        self._collectors: List[Callable[[], List[str]]] = []
+
+    def counter(self, name: str, description: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, description, labels))
+
+    def gauge(self, name: str, description: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, description, labels))
+
+    def histogram(self, name: str, description: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, description, labels, buckets))
+
+    def add_collector(self, collector: Callable[[], List[str]]):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+def record_timing(name: str, seconds: float):
+    """
+    Add a timing to the current request's Server-Timing breakdown, if any.
+    """
+    timings = server_timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+def format_server_timing(timings: List[Tuple[str, float]]) -> str:
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+metrics = MetricsRegistry()
+
+REQUEST_SECONDS = metrics.histogram(
+    "luma_http_request_seconds", "Time spent serving API requests.", ["route", "status"]
+)
+REQUESTS_IN_FLIGHT = metrics.gauge(
+    "luma_http_requests_in_flight", "API requests currently being served.", ["route"]
+)
+ADMISSION_REJECTIONS = metrics.counter(
+    "luma_admission_rejections_total", "Search requests turned away by admission control.", ["reason"]
+)
+ADMISSION_WAITING = metrics.gauge(
+    "luma_admission_waiting", "Search requests waiting for a pipeline slot."
+)
+SEARCH_COALESCED = metrics.counter(
+    "luma_search_coalesced_total", "Search requests that shared an identical in-flight request."
+)
+STAGE_SECONDS = metrics.histogram(
+    "luma_stage_seconds", "Time spent in each pipeline stage of a search request.", ["stage"]
+)
+SEARCH_ENGINE_SECONDS = metrics.histogram(
+    "luma_search_engine_seconds", "Latency of individual search engine queries.", ["engine", "outcome"]
+)
+SEARCH_ENGINE_FALLBACKS = metrics.counter(
+    "luma_search_engine_fallbacks_total", "Times a further search engine was started.", ["engine", "reason"]
+)
+PAGE_FETCH_SECONDS = metrics.histogram(
+    "luma_page_fetch_seconds", "Time to download a result page.", ["outcome"]
+)
+PAGE_EXTRACT_SECONDS = metrics.histogram(
+    "luma_page_extract_seconds", "Time to extract the main text of a page.", ["extractor"]
+)
+EXTRACTION_POOL_EVENTS = metrics.counter(
+    "luma_extraction_pool_events_total", "Extraction process pool replacements, by cause.", ["event"]
+)
+PAGE_STORE_LOOKUPS = metrics.counter(
+    "luma_page_store_lookups_total", "Result page lookups in the URL-level page store.", ["outcome"]
+)
+BLOCKED_DOMAINS = metrics.counter(
+    "luma_blocked_domains_total", "Result pages skipped because their domain blocks scraping.", ["domain"]
+)
+LLM_CALL_SECONDS = metrics.histogram(
+    "luma_llm_call_seconds", "Latency of model analysis calls.", ["model", "outcome"]
+)
+LLM_RETRIES = metrics.counter(
+    "luma_llm_retries_total", "Provider calls retried after a rate limit or transient error.", ["provider"]
+)
+ANSWER_SEMANTIC_HITS = metrics.counter(
+    "luma_answer_semantic_hits_total", "Analyses served from a near-duplicate earlier query.", ["model"]
+)
+DUPLICATE_SOURCES = metrics.counter(
+    "luma_duplicate_sources_total", "Search results dropped as copies of a higher-ranked result.", ["kind"]
+)
+WARM_REFRESHES = metrics.counter(
+    "luma_warm_refreshes_total", "Popular and listed queries handled by the cache warmer.", ["outcome"]
+)
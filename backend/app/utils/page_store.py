@@ -0,0 +1,84 @@
+import time
+from typing import Optional
+from app.utils.cache import cache_store, get_shared_backend, make_key, Codec
+
+class StoredPage:
+    """
+    Extracted text of a page with the validators needed to revalidate it.
+    """
+    __slots__ = ("url", "text", "etag", "last_modified", "fetched_at")
+
+    def __init__(self, url: str, text: str, etag: Optional[str], last_modified: Optional[str], fetched_at: float):
+        self.url = url
+        self.text = text
+        self.etag = etag
+        self.last_modified = last_modified
+        # Wall-clock time, since stored pages are shared between processes
+        self.fetched_at = fetched_at
+
+PAGE_CODEC = Codec(
+    lambda page: [page.url, page.text, page.etag, page.last_modified, page.fetched_at],
+    lambda row: StoredPage(*row)
+)
+
+class PageStore:
+    """
+    URL-level store of extracted pages, shared by every query that returns them.
+
+    Pages are served as-is while fresh (fresh_for seconds after they were last
+    fetched or revalidated) and kept for revalidation for keep_for seconds.
+    Entries live in the in-memory cache_store and, when CACHE_BACKEND selects
+    one, in the shared backend so they survive restarts.
+    """
+    namespace = "pages"
+
+    def __init__(self, fresh_for: float = 3600, keep_for: float = 7 * 24 * 3600, max_entries: int = 1000):
+        self.fresh_for = fresh_for
+        self.keep_for = keep_for
+        cache_store.set_namespace_limit(self.namespace, max_entries)
+
+    def is_fresh(self, page: StoredPage) -> bool:
+        return time.time() - page.fetched_at < self.fresh_for
+
+    async def get(self, url: str) -> Optional[StoredPage]:
+        """
+        Look up the stored page for a URL, in memory first, then in the backend.
+        """
+        found, page = cache_store.get(self.namespace, url)
+        if found:
+            return page
+
+        backend = get_shared_backend()
+        if backend is None:
+            return None
+        try:
+            data = await backend.get(self._backend_key(url))
+        except Exception as e:
+            cache_store.record(self.namespace, "shared_errors")
+            print(f"Cache backend error: {str(e)}")
+            return None
+        if data is None:
+            return None
+
+        page = PAGE_CODEC.loads(data)
+        cache_store.set(self.namespace, url, page, self.keep_for)
+        cache_store.record(self.namespace, "shared_hits")
+        return page
+
+    async def put(self, page: StoredPage):
+        """
+        Store a freshly fetched or revalidated page.
+        """
+        cache_store.set(self.namespace, page.url, page, self.keep_for)
+
+        backend = get_shared_backend()
+        if backend is None:
+            return
+        try:
+            await backend.set(self._backend_key(page.url), PAGE_CODEC.dumps(page), self.keep_for)
+        except Exception as e:
+            cache_store.record(self.namespace, "shared_errors")
+            print(f"Cache backend error: {str(e)}")
+
+    def _backend_key(self, url: str) -> str:
+        return f"{self.namespace}:{make_key(url)}"
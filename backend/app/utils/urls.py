@@ -0,0 +1,88 @@
+import re
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Query parameters that only track where a click came from
+TRACKING_PARAMS = {
+    "gclid", "dclid", "fbclid", "msclkid", "yclid", "mc_cid", "mc_eid", "igshid", "ref_src", "_ga", "_gl",
+}
+TRACKING_PREFIXES = ("utm_", "pk_", "hsa_")
+
+# Host labels of mobile and AMP variants of a site: m.example.com,
+# en.m.wikipedia.org
+VARIANT_HOST_LABELS = {"m", "mobile", "amp"}
+
+# AMP page variants: /amp/... or .../amp, and .../page.amp.html
+AMP_SEGMENT = re.compile(r"/amp(?=/|$)")
+AMP_SUFFIX = re.compile(r"\.amp(?=\.html?$)")
+
+# Google's AMP cache serves https://example.com/page as
+# https://example-com.cdn.ampproject.org/c/s/example.com/page
+AMP_CACHE_PATH = re.compile(r"^/[a-z]/(?P<secure>s/)?(?P<rest>.+)$")
+
+def canonicalize_url(url: str) -> str:
+    """
+    Normalize a result URL before it is fetched: unwrap search engine
+    redirects and the AMP cache, lowercase the host, and drop tracking
+    parameters, fragments and default ports. The result is the same page;
+    the lossy mobile and AMP rules are only applied by url_key.
+
+    URLs that cannot be parsed are returned unchanged.
+    """
+    try:
+        parts = urlsplit(url.strip())
+        host = (parts.hostname or "").lower()
+        port = parts.port
+    except ValueError:
+        return url
+    if parts.scheme not in ("http", "https") or not host or parts.username:
+        return url
+
+    # Redirect wrappers: google.com/url?q=..., duckduckgo.com/l/?uddg=...
+    params = parse_qsl(parts.query, keep_blank_values=True)
+    if (host.endswith("google.com") and parts.path == "/url") or (host.endswith("duckduckgo.com") and parts.path == "/l/"):
+        for name, value in params:
+            if name in ("q", "url", "uddg") and value.startswith("http"):
+                return canonicalize_url(value)
+
+    if host.endswith(".cdn.ampproject.org"):
+        match = AMP_CACHE_PATH.match(parts.path)
+        if match:
+            scheme = "https" if match.group("secure") else "http"
+            query = f"?{parts.query}" if parts.query else ""
+            return canonicalize_url(f"{scheme}://{match.group('rest')}{query}")
+
+    kept = [(name, value) for name, value in params if not _is_tracking(name.lower())]
+    # Re-encoding could change a query the site relies on, so only do it when needed
+    query = parts.query if len(kept) == len(params) else urlencode(kept)
+    default_port = (parts.scheme, port) in (("http", 80), ("https", 443))
+    netloc = host if port is None or default_port else f"{host}:{port}"
+    return urlunsplit((parts.scheme, netloc, parts.path or "/", query, ""))
+
+def url_key(url: str) -> str:
+    """
+    Identity of a page for deduplication: its canonical URL without scheme,
+    "www.", trailing slash or parameter order, and with mobile and AMP
+    variants folded into the main page.
+
+    Only for comparing URLs: /dictionary/amp is taken for an AMP copy of
+    /dictionary, so the key is not a URL to fetch.
+    """
+    parts = urlsplit(canonicalize_url(url))
+    labels = parts.netloc.split(".")
+    # Keep the last two labels, the site's own name: amp.dev stays as it is
+    labels = [label for label in labels[:-2] if label not in VARIANT_HOST_LABELS and label != "www"] + labels[-2:]
+    host = ".".join(labels)
+    path = AMP_SUFFIX.sub("", AMP_SEGMENT.sub("", parts.path)).rstrip("/")
+    params = [
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not _is_amp_switch(name.lower(), value.lower())
+    ]
+    query = urlencode(sorted(params))
+    return f"{host}{path}?{query}" if query else f"{host}{path}"
+
+def _is_tracking(name: str) -> bool:
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+def _is_amp_switch(name: str, value: str) -> bool:
+    # ?amp, ?amp=1, ?output=amp
+    return (name == "amp" and value in ("", "1", "true")) or (name == "output" and value == "amp")
@@ -0,0 +1,175 @@
+"""
+Measure memory allocation and garbage collection on the per-request hot path.
+
+Runs the CPU-side work of one search request in-process, without any network:
+parsing a saved results page, building the model contexts from page texts of
+realistic size, assembling the prompts and rendering the API response.
+Reports the peak traced memory of each of these stages per request, the
+garbage collections and collector pause time the requests caused, and writes
+a JSON report. The search stage includes the HTML parser's own arena (about
+1 MB per document with selectolax).
+
+Usage (from the backend directory):
+    python benchmarks/alloc_bench.py --requests 500
+    python benchmarks/alloc_bench.py --baseline old-alloc-report.json
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stubs import ANSWER, load_corpus
+
+STAGES = ["search", "context", "prompt", "response"]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500, help="requests to run")
+    parser.add_argument("--models", default="gemini-pro,llama3-70b-8192", help="model IDs to build prompts for")
+    parser.add_argument("--num-results", type=int, default=5)
+    parser.add_argument("--page-chars", type=int, default=20000, help="page text per source, in characters")
+    parser.add_argument("--output", default="alloc-report.json", help="where to write the JSON report")
+    parser.add_argument("--baseline", help="earlier JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed relative regression against the baseline")
+    return parser.parse_args()
+
+class GCTimer:
+    """
+    Counts garbage collections and the time spent in them through gc.callbacks.
+    """
+    def __init__(self):
+        self.collections = 0
+        self.pause = 0.0
+        self._started = 0.0
+
+    def __call__(self, phase: str, info: Dict[str, Any]):
+        if phase == "start":
+            self._started = time.perf_counter()
+        else:
+            self.collections += 1
+            self.pause += time.perf_counter() - self._started
+
+def benchmark(args) -> Dict[str, Any]:
+    from app.api.models import SearchResponse, SearchResult, AIAnalysis
+    from app.services.search_service import SearchService
+    from app.services.context_service import Source
+    from app.services.llm_service import LLMService
+    from app.utils.extraction import Extractor
+
+    corpus = load_corpus()
+    search_service = SearchService()
+    llm_service = LLMService()
+    models = [model for model in args.models.split(",") if model]
+
+    # Page text is extracted once up front: extraction runs in the pool and is
+    # measured by pipeline_bench, not here
+    extractor = Extractor()
+    texts = []
+    for name, html in corpus.items():
+        if name.startswith("article_"):
+            text = extractor.extract(html.encode("utf-8"), "utf-8")[0]
+            texts.append((text + "\n") * (args.page_chars // (len(text) + 1) + 1))
+    serp = corpus["serp_google.html"]
+    peaks: Dict[str, List[int]] = {stage: [] for stage in STAGES}
+
+    def measure(stage: str, call):
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        value = call()
+        _, peak = tracemalloc.get_traced_memory()
+        peaks[stage].append(peak - before)
+        return value
+
+    def request(i: int):
+        query = f"python asyncio tutorial #{i}"
+        results = measure("search", lambda: search_service._parse_google(serp, args.num_results))
+        sources = [
+            Source(result.url, result.title, result.snippet, texts[(i + rank) % len(texts)][:args.page_chars])
+            for rank, result in enumerate(results)
+        ]
+        contexts = measure("context", lambda: [llm_service.build_context(query, sources, model) for model in models])
+        measure("prompt", lambda: [llm_service._generate_prompt(query, context) for context in contexts])
+        measure("response", lambda: SearchResponse(
+            query=query,
+            web_results=[SearchResult.from_record(result) for result in results],
+            ai_analyses={model: AIAnalysis(ai_model_id=model, content=ANSWER) for model in models},
+            included_sources=[source.url for source in sources if source.text]
+        ).model_dump_json())
+
+    tracemalloc.start()
+    # Warm up imports, caches and interned strings before measuring
+    for i in range(20):
+        request(i)
+    for stage in STAGES:
+        peaks[stage].clear()
+
+    timer = GCTimer()
+    gc.collect()
+    gc.callbacks.append(timer)
+    try:
+        started = time.perf_counter()
+        for i in range(args.requests):
+            request(i)
+        elapsed = time.perf_counter() - started
+    finally:
+        tracemalloc.stop()
+        gc.callbacks.remove(timer)
+
+    result = {"requests": args.requests}
+    for stage in STAGES:
+        result[f"{stage}_peak_kb"] = round(sum(peaks[stage]) / len(peaks[stage]) / 1024, 1)
+    result.update({
+        "gc_collections_per_1k": round(timer.collections * 1000 / args.requests, 1),
+        "gc_pause_ms_per_1k": round(timer.pause * 1000 * 1000 / args.requests, 2),
+        # Includes tracing overhead; only comparable between runs of this script
+        "traced_ms_per_request": round(elapsed * 1000 / args.requests, 3),
+    })
+    return result
+
+def compare(result: Dict[str, Any], baseline_path: str, tolerance: float) -> List[str]:
+    """
+    Return a description of every measurement that regressed against the baseline.
+    """
+    with open(baseline_path) as f:
+        before = json.load(f)["result"]
+
+    regressions = []
+    for measurement in [f"{stage}_peak_kb" for stage in STAGES] + ["gc_collections_per_1k"]:
+        if result[measurement] > before[measurement] * (1 + tolerance):
+            regressions.append(f"{measurement}: {before[measurement]} -> {result[measurement]}")
+    return regressions
+
+def main():
+    args = parse_args()
+    os.environ.setdefault("CACHE_BACKEND", "memory")
+    result = benchmark(args)
+    for measurement, value in result.items():
+        print(f"{measurement:<26} {value}")
+
+    report = {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": vars(args),
+        "result": result,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+
+    if args.baseline:
+        regressions = compare(result, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Report how long the selectolax and BeautifulSoup parsers take on the saved
+SERP and article pages in benchmarks/corpus. That both extract the same
+results is checked by tests/test_parser_parity.py.
+
+Usage (from the backend directory):
+    python benchmarks/parser_bench.py [--repeat N]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.search_service import SearchService
+from app.utils.html_parser import BeautifulSoupParser, SelectolaxParser
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+def load_corpus():
+    pages = {}
+    for name in sorted(os.listdir(CORPUS_DIR)):
+        if name.endswith(".html"):
+            with open(os.path.join(CORPUS_DIR, name), encoding="utf-8") as f:
+                pages[name] = f.read()
+    return pages
+
+def extract(parser, name: str, html: str):
+    """
+    Run the extraction that applies to a corpus page with the given parser.
+    """
+    if name.startswith("serp_"):
+        service = SearchService()
+        service.html_parser = parser
+        engine = name[len("serp_"):-len(".html")]
+        results = getattr(service, f"_parse_{engine}")(html, 10)
+        return [(result.title, result.url, result.snippet) for result in results]
+    return parser.extract_main_text(html)
+
+def timed(parser, name: str, html: str, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        extract(parser, name, html)
+    return (time.perf_counter() - start) / repeat * 1000
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--repeat", type=int, default=50, help="timing iterations per page")
+    args = arg_parser.parse_args()
+
+    reference = BeautifulSoupParser()
+    fast = SelectolaxParser()
+
+    print(f"{'page':<24} {'bs4 ms':>8} {'selectolax ms':>14}")
+    for name, html in load_corpus().items():
+        print(
+            f"{name:<24} "
+            f"{timed(reference, name, html, args.repeat):>8.3f} {timed(fast, name, html, args.repeat):>14.3f}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+Benchmark the search -> extract -> analyze pipeline against local stand-ins.
+
+Runs the real SearchService, ContentService and LLMService, plus the full
+FastAPI app through uvicorn, at several concurrency levels. Every request uses
+a fresh query so results measure the uncached path. Reports throughput,
+p50/p95/p99 latency and peak RSS per stage and writes a JSON report. Peak
+RSS is reset before each stage on Linux; elsewhere it is the running peak.
+
+Usage (from the backend directory):
+    python benchmarks/pipeline_bench.py --concurrency 1,4,16 --requests 40
+    python benchmarks/pipeline_bench.py --baseline old-report.json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import socket
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stubs import StubConfig, serve, stub_environment
+
+STAGES = ["search", "extract", "analyze", "e2e"]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=40, help="requests per stage and concurrency level")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"comma-separated subset of {STAGES}")
+    parser.add_argument("--models", default="gemini-pro,llama3-70b-8192", help="model IDs to analyze with")
+    parser.add_argument("--num-results", type=int, default=5)
+    parser.add_argument("--search-latency", type=float, default=0.05, help="stand-in search engine latency (s)")
+    parser.add_argument("--page-latency", type=float, default=0.1, help="stand-in page latency (s)")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="stand-in LLM latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.3, help="+/- fraction applied to every latency")
+    parser.add_argument("--output", default="benchmark-report.json", help="where to write the JSON report")
+    parser.add_argument("--baseline", help="earlier JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed relative p95/throughput regression against the baseline")
+    return parser.parse_args()
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def reset_peak_rss() -> bool:
+    """
+    Reset the process's peak RSS (Linux only), so that the next reading
+    covers one stage instead of the whole run. Returns False if unsupported.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def peak_rss_mb() -> float:
+    # VmHWM is the peak since the last reset_peak_rss(); elsewhere fall back
+    # to ru_maxrss, the lifetime peak, in kilobytes on Linux and bytes on macOS
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+async def run_stage(
+    stage: str,
+    operation: Callable[[int], Awaitable[Any]],
+    concurrency: int,
+    requests: int
+) -> Dict[str, Any]:
+    """
+    Run operation(i) for i in range(requests) with at most concurrency in flight.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await operation(i)
+            except Exception as e:
+                errors += 1
+                print(f"  {stage} request {i} failed: {str(e)}")
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    per_stage_rss = reset_peak_rss()
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    wall = time.perf_counter() - start
+
+    return {
+        "stage": stage,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": round(requests / wall, 2),
+        "p50_ms": round(percentile(latencies, 0.50), 1),
+        "p95_ms": round(percentile(latencies, 0.95), 1),
+        "p99_ms": round(percentile(latencies, 0.99), 1),
+        "peak_rss_mb": peak_rss_mb(),
+        # False where the peak could not be reset and covers the whole run
+        "peak_rss_per_stage": per_stage_rss,
+    }
+
+async def benchmark(args) -> List[Dict[str, Any]]:
+    # Import after the environment points at the stand-ins: the services read
+    # their configuration when they are constructed
+    import aiohttp
+    import uvicorn
+    from app.main import app
+    from app.api.routes import search_service, content_service, llm_service
+    from app.utils.http_client import http_client
+
+    levels = [int(level) for level in args.concurrency.split(",")]
+    stages = [stage for stage in args.stages.split(",") if stage]
+    models = [model for model in args.models.split(",") if model]
+
+    app_port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=app_port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    results = []
+    try:
+        async with aiohttp.ClientSession() as client:
+            for concurrency in levels:
+                def query(stage: str, i: int) -> str:
+                    return f"python asyncio {stage} c{concurrency} #{i}"
+
+                # Inputs for the later stages, prepared outside the measurements
+                web_results = [
+                    await search_service.search(query("prepared", i), args.num_results)
+                    for i in range(args.requests)
+                ] if {"extract", "analyze"} & set(stages) else []
+                sources = await content_service.extract_sources(web_results[0]) if "analyze" in stages else []
+
+                async def search(i: int):
+                    await search_service.search(query("search", i), args.num_results)
+
+                async def extract(i: int):
+                    await content_service.extract_sources(web_results[i])
+
+                async def analyze(i: int):
+                    analyses = await llm_service.analyze_all(query("analyze", i), sources, models)
+                    failed = [model for model, analysis in analyses.items() if analysis.content.startswith("Error")]
+                    if failed:
+                        raise RuntimeError(f"analysis failed for {failed}")
+
+                async def e2e(i: int):
+                    payload = {"query": query("e2e", i), "ai_model_ids": models, "num_results": args.num_results}
+                    async with client.post(f"http://127.0.0.1:{app_port}/api/search", json=payload) as response:
+                        if response.status != 200:
+                            raise RuntimeError(f"HTTP {response.status}")
+                        await response.read()
+
+                operations = {"search": search, "extract": extract, "analyze": analyze, "e2e": e2e}
+                for stage in stages:
+                    result = await run_stage(stage, operations[stage], concurrency, args.requests)
+                    results.append(result)
+                    print(
+                        f"{stage:<8} c={concurrency:<4} {result['throughput_rps']:>8.2f} req/s  "
+                        f"p50 {result['p50_ms']:>8.1f} ms  p95 {result['p95_ms']:>8.1f} ms  "
+                        f"p99 {result['p99_ms']:>8.1f} ms  rss {result['peak_rss_mb']:>7.1f} MB  "
+                        f"errors {result['errors']}"
+                    )
+    finally:
+        server.should_exit = True
+        await server_task
+        await http_client.close()
+
+    return results
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, tolerance: float) -> List[str]:
+    """
+    Return a description of every stage that regressed against the baseline.
+    """
+    with open(baseline_path) as f:
+        baseline = {(r["stage"], r["concurrency"]): r for r in json.load(f)["results"]}
+
+    regressions = []
+    for result in results:
+        before = baseline.get((result["stage"], result["concurrency"]))
+        if before is None:
+            continue
+        label = f"{result['stage']} c={result['concurrency']}"
+        if result["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{label}: p95 {before['p95_ms']} -> {result['p95_ms']} ms")
+        if result["throughput_rps"] < before["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{label}: throughput {before['throughput_rps']} -> {result['throughput_rps']} req/s")
+    return regressions
+
+def main():
+    args = parse_args()
+    config = StubConfig(args.search_latency, args.page_latency, args.llm_latency, args.jitter)
+
+    # Stand-ins run in their own process so they do not skew the measurements
+    stub_port = free_port()
+    stubs = multiprocessing.Process(target=serve, args=(config, "127.0.0.1", stub_port), daemon=True)
+    stubs.start()
+
+    os.environ.update(stub_environment(f"http://127.0.0.1:{stub_port}"))
+    # Every page lives on the same stand-in host, so lift the per-host limits
+    os.environ.setdefault("CONTENT_PER_HOST_LIMIT", "64")
+    os.environ.setdefault("HTTP_POOL_LIMIT_PER_HOST", "0")
+    os.environ.setdefault("CACHE_BACKEND", "memory")
+    # All load comes from one client; measure the pipeline, not the rate limiter
+    os.environ.setdefault("RATE_LIMIT_RPS", "0")
+
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", stub_port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+
+    try:
+        results = asyncio.run(benchmark(args))
+    finally:
+        stubs.terminate()
+
+    report = {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": vars(args),
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Check the API's cold-start cost against a budget.
+
+Measures, each in fresh processes, how long importing app.main takes and how
+long uvicorn takes to answer its first /health request. Also checks that the
+heavy modules only some requests need are not imported at startup. Exits with
+status 1 when a median exceeds its budget or a deferred module is imported
+eagerly.
+
+Usage (from the backend directory):
+    python benchmarks/startup_bench.py
+    python benchmarks/startup_bench.py --runs 10 --import-budget-ms 800 --ready-budget-ms 2000
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from typing import List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must not be imported by app.main. numpy and trafilatura are
+# loaded on first use or in the background after startup; the rest are not
+# used at all, or only as fallbacks.
+DEFERRED_MODULES = ["numpy", "trafilatura", "bs4", "google.generativeai", "groq"]
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "modules": [m for m in %r if m in sys.modules]}))
+"""
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes per measurement")
+    parser.add_argument("--import-budget-ms", type=float, default=1000, help="budget for importing app.main")
+    parser.add_argument("--ready-budget-ms", type=float, default=3000, help="budget for the first /health response")
+    parser.add_argument("--output", default="startup-report.json", help="where to write the JSON report")
+    return parser.parse_args()
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def environment():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = BACKEND_DIR
+    # Keep the startup path local: no shared cache backend, no warming loop
+    env.setdefault("CACHE_BACKEND", "memory")
+    env.setdefault("WARM_ENABLED", "false")
+    return env
+
+def measure_import() -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT % DEFERRED_MODULES],
+        cwd=BACKEND_DIR, env=environment(), capture_output=True, text=True, check=True
+    ).stdout
+    # The services may print warnings (e.g. missing API keys) before the result
+    return json.loads(output.strip().splitlines()[-1])
+
+def measure_ready(timeout: float = 30) -> float:
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=environment(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError(f"server did not become ready within {timeout:g} seconds")
+    finally:
+        server.terminate()
+        server.wait()
+
+def main():
+    args = parse_args()
+    failures: List[str] = []
+
+    imports = [measure_import() for _ in range(args.runs)]
+    import_ms = statistics.median(run["seconds"] for run in imports) * 1000
+    eager = sorted({module for run in imports for module in run["modules"]})
+    ready_ms = statistics.median(measure_ready() for _ in range(args.runs)) * 1000
+
+    print(f"import app.main   median {import_ms:8.1f} ms  (budget {args.import_budget_ms:g} ms)")
+    print(f"first /health     median {ready_ms:8.1f} ms  (budget {args.ready_budget_ms:g} ms)")
+    print(f"eager imports     {', '.join(eager) or 'none'}")
+
+    if import_ms > args.import_budget_ms:
+        failures.append(f"importing app.main took {import_ms:.1f} ms")
+    if ready_ms > args.ready_budget_ms:
+        failures.append(f"first /health response took {ready_ms:.1f} ms")
+    for module in eager:
+        failures.append(f"{module} is imported at startup")
+
+    report = {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": vars(args),
+        "result": {"import_ms": round(import_ms, 1), "ready_ms": round(ready_ms, 1), "eager_imports": eager},
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+
+    for failure in failures:
+        print(f"OVER BUDGET {failure}")
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Local stand-ins for everything the search pipeline talks to: the three search
+engines, the result pages and the Groq and Gemini APIs. Responses come from
+the saved pages in benchmarks/corpus, with configurable latency and jitter.
+
+Run on its own (from the backend directory):
+    python benchmarks/stubs.py --port 8900
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import zlib
+from typing import Dict, List
+from urllib.parse import quote
+from aiohttp import web
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+ANSWER = (
+    "## Summary\n\n"
+    "asyncio is Python's standard library for writing concurrent code with the "
+    "async/await syntax. It provides an event loop, coroutines, tasks and "
+    "high-level APIs for network IO and subprocesses.\n\n"
+    "- Use `asyncio.run()` to start the event loop\n"
+    "- Use `asyncio.create_task()` and `asyncio.gather()` to run coroutines concurrently\n"
+    "- Prefer async libraries such as aiohttp for network IO\n"
+)
+
+class StubConfig:
+    """
+    Latencies in seconds; jitter is the +/- fraction applied to each of them.
+    """
+    def __init__(
+        self,
+        search_latency: float = 0.05,
+        page_latency: float = 0.1,
+        llm_latency: float = 0.5,
+        jitter: float = 0.3,
+        llm_chunks: int = 20
+    ):
+        self.search_latency = search_latency
+        self.page_latency = page_latency
+        self.llm_latency = llm_latency
+        self.jitter = jitter
+        self.llm_chunks = llm_chunks
+
+    def delay(self, latency: float) -> float:
+        return max(0.0, latency * (1 + random.uniform(-self.jitter, self.jitter)))
+
+def load_corpus() -> Dict[str, str]:
+    pages = {}
+    for name in sorted(os.listdir(CORPUS_DIR)):
+        if name.endswith(".html"):
+            with open(os.path.join(CORPUS_DIR, name), encoding="utf-8") as f:
+                pages[name] = f.read()
+    return pages
+
+def build_app(config: StubConfig) -> web.Application:
+    corpus = load_corpus()
+    articles: List[str] = [html for name, html in corpus.items() if name.startswith("article_")]
+
+    def serp(name: str, request: web.Request) -> str:
+        # Point every result at /site/ on this server. The query is folded into
+        # the path so that different queries never share page URLs.
+        tag = format(zlib.crc32(request.query.get("q", "").encode("utf-8")), "x")
+        prefix = f"{request.scheme}://{request.host}/site/{tag}/"
+        html = corpus[name].replace("https://", prefix)
+        return html.replace("https%3A%2F%2F", quote(prefix, safe=""))
+
+    def engine(name: str):
+        async def handler(request: web.Request) -> web.Response:
+            await asyncio.sleep(config.delay(config.search_latency))
+            return web.Response(text=serp(name, request), content_type="text/html")
+        return handler
+
+    async def page(request: web.Request) -> web.Response:
+        await asyncio.sleep(config.delay(config.page_latency))
+        path = request.match_info["path"].split("/", 1)[-1]
+        index = zlib.crc32(path.encode("utf-8")) % len(articles)
+        # Pages never change, so they revalidate like a well-behaved origin
+        etag = f'"article-{index}"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(text=articles[index], content_type="text/html", headers={"ETag": etag})
+
+    async def groq(request: web.Request) -> web.StreamResponse:
+        payload = await request.json()
+        if not payload.get("stream"):
+            await asyncio.sleep(config.delay(config.llm_latency))
+            return web.json_response({"choices": [{"message": {"role": "assistant", "content": ANSWER}}]})
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for chunk in chunks(ANSWER, config.llm_chunks):
+            await asyncio.sleep(config.delay(config.llm_latency) / config.llm_chunks)
+            data = {"choices": [{"delta": {"content": chunk}}]}
+            await response.write(f"data: {json.dumps(data)}\n\n".encode("utf-8"))
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    async def gemini(request: web.Request) -> web.StreamResponse:
+        await request.read()
+        if not request.match_info["action"].endswith(":streamGenerateContent"):
+            await asyncio.sleep(config.delay(config.llm_latency))
+            return web.json_response({
+                "candidates": [{"content": {"role": "model", "parts": [{"text": ANSWER}]}, "finishReason": "STOP"}]
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for chunk in chunks(ANSWER, config.llm_chunks):
+            await asyncio.sleep(config.delay(config.llm_latency) / config.llm_chunks)
+            data = {"candidates": [{"content": {"role": "model", "parts": [{"text": chunk}]}}]}
+            await response.write(f"data: {json.dumps(data)}\n\n".encode("utf-8"))
+        return response
+
+    app = web.Application()
+    app.router.add_get("/google/search", engine("serp_google.html"))
+    app.router.add_get("/bing/search", engine("serp_bing.html"))
+    app.router.add_get("/ddg/html/", engine("serp_ddg.html"))
+    app.router.add_get("/site/{path:.*}", page)
+    app.router.add_post("/groq/chat/completions", groq)
+    app.router.add_post("/gemini/v1beta/models/{action}", gemini)
+    return app
+
+def chunks(text: str, count: int) -> List[str]:
+    size = max(1, -(-len(text) // count))
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+def stub_environment(base_url: str) -> Dict[str, str]:
+    """
+    Environment variables that point the services at stand-ins on base_url.
+    """
+    return {
+        "SEARCH_GOOGLE_URL": f"{base_url}/google/search",
+        "SEARCH_BING_URL": f"{base_url}/bing/search",
+        "SEARCH_DDG_URL": f"{base_url}/ddg/html/",
+        "GROQ_API_URL": f"{base_url}/groq/chat/completions",
+        "GEMINI_API_BASE": f"{base_url}/gemini",
+        "GROQ_API_KEY": "stub",
+        "GEMINI_API_KEY": "stub",
+    }
+
+def serve(config: StubConfig, host: str, port: int):
+    """
+    Serve the stand-ins until the process is stopped.
+    """
+    web.run_app(build_app(config), host=host, port=port, print=None, access_log=None)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--search-latency", type=float, default=0.05)
+    parser.add_argument("--page-latency", type=float, default=0.1)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.3)
+    args = parser.parse_args()
+
+    print(f"Stand-ins listening on http://{args.host}:{args.port}")
+    for key, value in stub_environment(f"http://{args.host}:{args.port}").items():
+        print(f"{key}={value}")
+    serve(StubConfig(args.search_latency, args.page_latency, args.llm_latency, args.jitter), args.host, args.port)
+
+if __name__ == "__main__":
+    main()
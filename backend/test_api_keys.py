@@ -1,10 +1,13 @@
 import os
+import asyncio
 from dotenv import load_dotenv
-import google.generativeai as genai
 
 # Load environment variables
 load_dotenv()
 
+from app.services.llm_providers import create_providers, load_model_registry
+from app.utils.http_client import http_client
+
 # Get API keys
 gemini_api_key = os.getenv("GEMINI_API_KEY")
 groq_api_key = os.getenv("GROQ_API_KEY")
@@ -12,13 +15,24 @@ groq_api_key = os.getenv("GROQ_API_KEY")
 print(f"Gemini API Key: {'Found' if gemini_api_key else 'Not found'}")
 print(f"Groq API Key: {'Found' if groq_api_key else 'Not found'}")
 
-# Test Gemini API
-if gemini_api_key:
+async def check_providers():
+    # Test each provider that has a key with the first model it serves
+    providers = create_providers()
+    tested = set()
+    await http_client.start()
     try:
-        genai.configure(api_key=gemini_api_key)
-        model = genai.GenerativeModel('gemini-pro')
-        response = model.generate_content("Hello, world!")
-        print("Gemini API test: Success")
-        print(f"Response: {response.text}")
-    except Exception as e:
-        print(f"Gemini API test: Failed - {str(e)}") 
\ No newline at end of file
+        for spec in load_model_registry():
+            if spec.api in tested or not providers[spec.api].api_key:
+                continue
+            tested.add(spec.api)
+            try:
+                response = await providers[spec.api].complete(spec.api_model, "Hello, world!")
+                print(f"{spec.provider} API test ({spec.api_model}): Success")
+                print(f"Response: {response}")
+            except Exception as e:
+                print(f"{spec.provider} API test ({spec.api_model}): Failed - {str(e)}")
+    finally:
+        await http_client.close()
+
+if __name__ == "__main__":
+    asyncio.run(check_providers())
@@ -0,0 +1,79 @@
+"""
+In-process stand-in for a Redis server, speaking just enough of the Redis
+protocol (RESP) for RedisBackend: GET, SET with PX, DEL, AUTH, SELECT and PING.
+"""
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+class RespStub:
+    def __init__(self, delay: float = 0):
+        # Seconds to wait before every reply, to test cancelled commands
+        self.delay = delay
+        self.data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+        self.commands: List[List[bytes]] = []
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"redis://{host}:{port}/0"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                command = await self._read_command(reader)
+                self.commands.append(command)
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                writer.write(self._execute(command))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_command(self, reader: asyncio.StreamReader) -> List[bytes]:
+        header = await reader.readuntil(b"\r\n")
+        if header[:1] != b"*":
+            raise ConnectionError(f"Unexpected request: {header!r}")
+        parts = []
+        for _ in range(int(header[1:-2])):
+            length = int((await reader.readuntil(b"\r\n"))[1:-2])
+            parts.append((await reader.readexactly(length + 2))[:-2])
+        return parts
+
+    def _execute(self, command: List[bytes]) -> bytes:
+        name = command[0].upper()
+        if name in (b"AUTH", b"SELECT", b"PING"):
+            return b"+OK\r\n"
+        if name == b"GET":
+            value = self._lookup(command[1])
+            return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+        if name == b"SET":
+            expires_at = None
+            if len(command) >= 5 and command[3].upper() == b"PX":
+                expires_at = time.monotonic() + int(command[4]) / 1000
+            self.data[command[1]] = (command[2], expires_at)
+            return b"+OK\r\n"
+        if name == b"DEL":
+            removed = sum(1 for key in command[1:] if self.data.pop(key, None) is not None)
+            return b":%d\r\n" % removed
+        return b"-ERR unknown command\r\n"
+
+    def _lookup(self, key: bytes) -> Optional[bytes]:
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
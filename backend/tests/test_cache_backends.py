@@ -0,0 +1,131 @@
+import asyncio
+import os
+import threading
+import pytest
+from app.utils.cache import Codec, RedisBackend, SQLiteBackend, TEXT_CODEC
+from resp_stub import RespStub
+
+# Structured values, encoded like the services' result codecs
+RECORD_CODEC = Codec(
+    lambda records: [[record["title"], record["url"]] for record in records],
+    lambda rows: [{"title": row[0], "url": row[1]} for row in rows]
+)
+
+# (codec, value); None stores the raw bytes
+VALUES = [
+    (None, b"\x00raw bytes\xff"),
+    (TEXT_CODEC, "Plain text, with unicode: é中"),
+    (RECORD_CODEC, [{"title": "Python", "url": "https://python.org/"}, {"title": "PyPI", "url": "https://pypi.org/"}]),
+]
+
+def run_with_backend(kind: str, tmp_path, test):
+    """
+    Run test(backend) on a fresh backend of the given kind, in a new event loop.
+    """
+    async def main():
+        if kind == "sqlite":
+            backend = SQLiteBackend(os.path.join(tmp_path, "cache.sqlite3"))
+            try:
+                await test(backend)
+            finally:
+                await backend.close()
+            return
+        stub = RespStub()
+        await stub.start()
+        backend = RedisBackend(stub.url)
+        try:
+            await test(backend)
+        finally:
+            await backend.close()
+            await stub.close()
+    asyncio.run(main())
+
+def encode(codec, value) -> bytes:
+    return value if codec is None else codec.dumps(value)
+
+def decode(codec, data: bytes):
+    return data if codec is None else codec.loads(data)
+
+@pytest.mark.parametrize("kind", ["sqlite", "redis"])
+@pytest.mark.parametrize("codec, value", VALUES)
+def test_round_trip(kind, codec, value, tmp_path):
+    async def test(backend):
+        assert await backend.get("missing") is None
+        await backend.set("key", encode(codec, value), ttl=60)
+        assert decode(codec, await backend.get("key")) == value
+        # Overwrite
+        await backend.set("key", encode(codec, value[:1]), ttl=60)
+        assert decode(codec, await backend.get("key")) == value[:1]
+    run_with_backend(kind, tmp_path, test)
+
+@pytest.mark.parametrize("kind", ["sqlite", "redis"])
+@pytest.mark.parametrize("codec, value", VALUES)
+def test_ttl_expiry(kind, codec, value, tmp_path):
+    async def test(backend):
+        await backend.set("short", encode(codec, value), ttl=0.05)
+        await backend.set("long", encode(codec, value), ttl=60)
+        await asyncio.sleep(0.1)
+        assert await backend.get("short") is None
+        assert decode(codec, await backend.get("long")) == value
+    run_with_backend(kind, tmp_path, test)
+
+@pytest.mark.parametrize("kind", ["sqlite", "redis"])
+@pytest.mark.parametrize("codec, value", VALUES)
+def test_delete(kind, codec, value, tmp_path):
+    async def test(backend):
+        await backend.set("key", encode(codec, value), ttl=60)
+        await backend.delete("key")
+        assert await backend.get("key") is None
+        # Deleting a missing key is not an error
+        await backend.delete("key")
+    run_with_backend(kind, tmp_path, test)
+
+def test_redis_cancelled_command_does_not_leak_its_reply():
+    async def main():
+        stub = RespStub(delay=0.2)
+        await stub.start()
+        backend = RedisBackend(stub.url)
+        try:
+            await backend.set("a", b"A", ttl=60)
+            await backend.set("b", b"B", ttl=60)
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(backend.get("a"), timeout=0.05)
+            assert await backend.get("b") == b"B"
+        finally:
+            await backend.close()
+            await stub.close()
+    asyncio.run(main())
+
+def test_redis_sends_auth_and_select():
+    async def main():
+        stub = RespStub()
+        await stub.start()
+        backend = RedisBackend(stub.url.replace("redis://", "redis://:secret@").replace("/0", "/2"))
+        try:
+            await backend.get("key")
+        finally:
+            await backend.close()
+            await stub.close()
+        assert stub.commands[:2] == [[b"AUTH", b"secret"], [b"SELECT", b"2"]]
+    asyncio.run(main())
+
+def test_sqlite_opens_database_off_the_event_loop(tmp_path):
+    async def main():
+        loop_thread = threading.get_ident()
+        opened_on = []
+        backend = SQLiteBackend(os.path.join(tmp_path, "cache.sqlite3"))
+        connect = backend._connect
+
+        def tracking_connect():
+            if backend._conn is None:
+                opened_on.append(threading.get_ident())
+            return connect()
+
+        backend._connect = tracking_connect
+        try:
+            await backend.set("key", b"value", ttl=60)
+            assert await backend.get("key") == b"value"
+        finally:
+            await backend.close()
+        assert opened_on and loop_thread not in opened_on
+    asyncio.run(main())
@@ -0,0 +1,49 @@
+from typing import Tuple
+from app.utils.health import BackendHealth, HealthTracker, Permit, HALF_OPEN, OPEN
+
+def half_open_backend() -> Tuple[BackendHealth, Permit]:
+    health = BackendHealth("engine", failure_threshold=1, cooldown=0)
+    ordinary = health.allow()
+    health.record_failure(0.1)
+    assert health.state == OPEN
+    # The call admitted before the circuit opened stands in for any call that
+    # is not the probe, e.g. a losing hedge leg
+    return health, ordinary
+
+def test_half_open_lets_one_probe_through():
+    health, _ = half_open_backend()
+    probe = health.allow()
+    assert probe is not None and probe.probe
+    assert health.state == HALF_OPEN
+    assert health.allow() is None
+
+def test_cancelled_ordinary_call_keeps_probe_claimed():
+    health, ordinary = half_open_backend()
+    probe = health.allow()
+    health.record_cancelled(ordinary)
+    assert health.probing
+    assert health.allow() is None
+    health.record_cancelled(probe)
+    assert health.allow() is not None
+
+def test_probe_outcome_closes_or_reopens_circuit():
+    health, _ = half_open_backend()
+    health.allow()
+    health.record_success(0.1)
+    assert health.allow() is not None and not health.probing
+
+    health.record_failure(0.1)
+    health.allow()
+    health.record_failure(0.1)
+    assert health.state == OPEN
+
+def test_order_returns_permits_and_falls_back_to_all_backends():
+    tracker = HealthTracker("test", ["a", "b"], adaptive=False)
+    assert [name for name, _ in tracker.order()] == ["a", "b"]
+    for name in ("a", "b"):
+        tracker.get(name).cooldown = 60
+        for _ in range(tracker.get(name).failure_threshold):
+            tracker.get(name).record_failure(0.1)
+    entries = tracker.order()
+    assert [name for name, _ in entries] == ["a", "b"]
+    assert not any(permit.probe for _, permit in entries)
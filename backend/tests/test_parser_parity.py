@@ -0,0 +1,28 @@
+import os
+import pytest
+from app.services.search_service import SearchService
+from app.utils.html_parser import BeautifulSoupParser, SelectolaxParser
+
+# Saved SERP and article pages, shared with the benchmarks
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "corpus")
+PAGES = sorted(name for name in os.listdir(CORPUS_DIR) if name.endswith(".html"))
+
+def extract(parser, name: str, html: str):
+    """
+    Run the extraction that applies to a corpus page with the given parser.
+    """
+    if name.startswith("serp_"):
+        service = SearchService()
+        service.html_parser = parser
+        engine = name[len("serp_"):-len(".html")]
+        results = getattr(service, f"_parse_{engine}")(html, 10)
+        return [(result.title, result.url, result.snippet) for result in results]
+    return parser.extract_main_text(html)
+
+@pytest.mark.parametrize("name", PAGES)
+def test_selectolax_matches_beautifulsoup(name):
+    with open(os.path.join(CORPUS_DIR, name), encoding="utf-8") as f:
+        html = f.read()
+    expected = extract(BeautifulSoupParser(), name, html)
+    assert expected, f"{name} extracts nothing"
+    assert extract(SelectolaxParser(), name, html) == expected
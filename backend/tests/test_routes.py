@@ -0,0 +1,102 @@
+import asyncio
+import httpx
+import pytest
+from starlette.requests import Request
+from app.api import routes
+from app.api.models import SearchRequest, SearchResponse
+from app.main import app
+
+def search_request(query: str = "python asyncio") -> SearchRequest:
+    return SearchRequest(query=query, ai_model_ids=["gemini-pro"])
+
+def client_request(disconnect: asyncio.Event, host: str = "127.0.0.1") -> Request:
+    """
+    A request whose client disconnects when the event is set.
+    """
+    async def receive():
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    scope = {"type": "http", "method": "POST", "path": "/api/search", "headers": [], "client": (host, 50000)}
+    return Request(scope, receive)
+
+def test_pipeline_is_cancelled_when_every_client_disconnects(monkeypatch):
+    started = []
+    cancelled = []
+
+    async def slow_search(request: SearchRequest) -> SearchResponse:
+        started.append(request.query)
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.append(request.query)
+            raise
+
+    monkeypatch.setattr(routes, "_run_search", slow_search)
+
+    async def main():
+        first_gone, second_gone = asyncio.Event(), asyncio.Event()
+        first = asyncio.create_task(routes.search(search_request(), client_request(first_gone)))
+        second = asyncio.create_task(routes.search(search_request(), client_request(second_gone)))
+        await asyncio.sleep(0.05)
+        assert started == ["python asyncio"]
+        assert len(routes._pipelines) == 1
+
+        # One client leaving keeps the pipeline running for the other
+        first_gone.set()
+        with pytest.raises(routes.HTTPException):
+            await first
+        await asyncio.sleep(0.01)
+        assert cancelled == []
+
+        second_gone.set()
+        with pytest.raises(routes.HTTPException):
+            await second
+        await asyncio.sleep(0.01)
+        assert cancelled == ["python asyncio"]
+        assert routes._pipelines == {} and routes._pipeline_waiters == {}
+
+    asyncio.run(main())
+
+def test_shared_pipeline_answers_every_client(monkeypatch):
+    calls = []
+
+    async def quick_search(request: SearchRequest) -> SearchResponse:
+        calls.append(request.query)
+        await asyncio.sleep(0.05)
+        return SearchResponse(query=request.query, web_results=[], ai_analyses={})
+
+    monkeypatch.setattr(routes, "_run_search", quick_search)
+
+    async def main():
+        never = asyncio.Event()
+        responses = await asyncio.gather(
+            routes.search(search_request("Python asyncio"), client_request(never)),
+            routes.search(search_request("python  asyncio"), client_request(never)),
+        )
+        assert calls == ["Python asyncio"]
+        assert [response.query for response in responses] == ["Python asyncio", "python  asyncio"]
+        assert routes._pipelines == {} and routes._pipeline_waiters == {}
+
+    asyncio.run(main())
+
+def test_rate_limited_search_returns_429_with_retry_after(monkeypatch):
+    async def quick_search(request: SearchRequest) -> SearchResponse:
+        return SearchResponse(query=request.query, web_results=[], ai_analyses={})
+
+    monkeypatch.setattr(routes, "_run_search", quick_search)
+    monkeypatch.setattr(routes.rate_limiter, "rate", 0.5)
+    monkeypatch.setattr(routes.rate_limiter, "burst", 2)
+    monkeypatch.setattr(routes.rate_limiter, "_buckets", type(routes.rate_limiter._buckets)())
+
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            body = {"query": "python asyncio", "ai_model_ids": []}
+            statuses = [(await client.post("/api/search", json=body)).status_code for _ in range(2)]
+            limited = await client.post("/api/search", json=body)
+        assert statuses == [200, 200]
+        assert limited.status_code == 429
+        assert int(limited.headers["Retry-After"]) >= 1
+
+    asyncio.run(main())